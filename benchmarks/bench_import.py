@@ -0,0 +1,129 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""
+Measures the cost of importing the library, and guards its budget.
+
+Every scenario runs in a fresh interpreter: importing the package alone,
+then using only the management API, then recognition. The time of the
+imports (as reported by python -X importtime), the peak memory and the heavy
+dependencies loaded are printed as JSON. Exits with an error if importing
+the package takes longer than the budget or loads a heavy dependency.
+
+The package measured is the one of this checkout, whatever PYTHONPATH is.
+"""
+
+from optparse import OptionParser
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies that importing the package alone must not load
+HEAVY_MODULES = ("requests", "PIL", "numpy", "orjson", "aiohttp")
+
+SCENARIOS = (
+    ("import", "import craftar"),
+    ("management", "import craftar; craftar.get_collection_list"),
+    ("recognition", "import craftar; craftar.search"),
+)
+
+# the peak memory is read from VmHWM, ru_maxrss is inherited through exec
+# from the process that started the interpreter, here the benchmark itself
+REPORT = """
+import json, sys
+try:
+    with open("/proc/self/status") as status:
+        max_rss_kb = int([line.split()[1] for line in status
+                          if line.startswith("VmHWM:")][0])
+except (IOError, IndexError):
+    # no /proc, e.g. on macOS, where the benchmark is not accounted apart
+    import resource
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "modules": len(sys.modules),
+    "heavy_modules": [m for m in %r if m in sys.modules],
+    "max_rss_kb": max_rss_kb,
+}))
+"""
+
+
+def measure(code):
+    "Run @code in a fresh interpreter, return its import time and footprint"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get("PYTHONPATH")] if path])
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c",
+         code + "\n" + REPORT % (HEAVY_MODULES,)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError(stderr.decode("utf-8"))
+    result = json.loads(stdout.decode("utf-8").splitlines()[-1])
+    # lines of "import time: self [us] | cumulative | imported package",
+    # the imports made by the package itself nested in its top level ones,
+    # leaving out the startup of the interpreter
+    import_us = 0
+    for line in stderr.decode("utf-8").splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit() and \
+                fields[2].startswith(" craftar"):
+            import_us += int(fields[1])
+    result["import_ms"] = import_us / 1000.0
+    return result
+
+
+def run(repeats):
+    results = []
+    for name, code in SCENARIOS:
+        # the first run may compile the modules, keep the median
+        runs = sorted((measure(code) for _ in range(repeats)),
+                      key=lambda result: result["import_ms"])
+        result = {"benchmark": "import", "scenario": name}
+        result.update(runs[len(runs) // 2])
+        results.append(result)
+    return results
+
+
+def check(results, budget):
+    "Return the reasons why importing the package is over budget, if any"
+    errors = []
+    for result in results:
+        if result["scenario"] != "import":
+            continue
+        if result["import_ms"] > budget:
+            errors.append("import craftar took %.1fms, over the budget of "
+                          "%.1fms" % (result["import_ms"], budget))
+        if result["heavy_modules"]:
+            errors.append("import craftar loaded %s" %
+                          ", ".join(result["heavy_modules"]))
+    return errors
+
+
+if __name__ == '__main__':
+    usage = "usage: %prog [-b BUDGET] [-r REPEATS]"
+    parser = OptionParser(usage)
+    parser.add_option('-b', '--budget',
+                      dest='budget',
+                      type='float',
+                      default=30.0,
+                      help="Milliseconds that importing the package may "
+                           "take.")
+    parser.add_option('-r', '--repeats',
+                      dest='repeats',
+                      type='int',
+                      default=5,
+                      help="Interpreters started for every scenario.")
+    (options, args) = parser.parse_args()
+
+    results = run(options.repeats)
+    print(json.dumps(results, indent=2))
+    errors = check(results, options.budget)
+    for error in errors:
+        sys.stderr.write("%s\n" % error)
+    sys.exit(1 if errors else 0)
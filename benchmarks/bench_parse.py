@@ -0,0 +1,116 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""
+Compares the cost of decoding and parsing large list responses.
+
+A synthetic page of items is decoded and parsed the way the library used to
+(requests' Response.json() and splitting every uri) and the way it does now
+(_loads, with orjson if installed, and _parse_object). Prints the median
+time per page of every path as JSON.
+"""
+
+from optparse import OptionParser
+import json
+import time
+
+import requests
+
+from craftar import settings
+from craftar._common import _loads, _parse_object
+
+ORJSON = getattr(_loads, "__module__", None) == "orjson"
+
+
+def make_page(size):
+    "Return the encoded response of a page of @size items"
+    prefix = "/api/%s" % settings.MANAGEMENT_API_VERSION
+    objects = [{
+        "uuid": "%032x" % i,
+        "resource_uri": "%s/item/%032x/" % (prefix, i),
+        "collection": "%s/collection/%032x/" % (prefix, 0),
+        "name": "item %d" % i,
+        "url": "http://example.com/%d" % i,
+        "custom": json.dumps({"index": i}),
+        "trackable": False,
+        "content": None,
+        "tags": ["%s/tag/%032x/" % (prefix, t) for t in range(3)],
+    } for i in range(size)]
+    meta = {"limit": size, "offset": 0, "total_count": size, "next": None,
+            "previous": None}
+    return json.dumps({"meta": meta, "objects": objects}).encode("utf-8")
+
+
+def _parse_object_split(_object):
+    "The parsing of objects before the fast path, for reference"
+    if "resource_uri" in _object:
+        del _object["resource_uri"]
+    for key in ["collection", "item", "version", "app", "tag"]:
+        if key in _object:
+            _object[key] = _object[key].split("/")[-2]
+    for key in ["collections", "tags"]:
+        if key in _object:
+            _object[key] = [uri.split("/")[-2] for uri in _object[key]]
+    return _object
+
+
+def parse_before(content):
+    response = requests.Response()
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    return [_parse_object_split(o) for o in response.json()["objects"]]
+
+
+def parse_stdlib(content):
+    decoded = json.loads(content.decode("utf-8"))
+    return [_parse_object(o) for o in decoded["objects"]]
+
+
+def parse_now(content):
+    return [_parse_object(o) for o in _loads(content)["objects"]]
+
+
+def run(sizes, repeats):
+    results = []
+    for size in sizes:
+        content = make_page(size)
+        assert parse_before(content) == parse_now(content)
+        for name, parse in (("before", parse_before),
+                            ("stdlib_json", parse_stdlib),
+                            ("now", parse_now)):
+            timings = []
+            for _ in range(repeats):
+                start = time.time()
+                parse(content)
+                timings.append(1000 * (time.time() - start))
+            timings.sort()
+            results.append({
+                "benchmark": "parse_page",
+                "path": name,
+                "objects": size,
+                "page_bytes": len(content),
+                "decoder": ORJSON and parse is parse_now and "orjson" or
+                "json",
+                "median_ms": timings[len(timings) // 2],
+            })
+    return results
+
+
+if __name__ == '__main__':
+    usage = "usage: %prog [-s SIZES] [-r REPEATS]"
+    parser = OptionParser(usage)
+    parser.add_option('-s', '--sizes',
+                      dest='sizes',
+                      default="100,1000",
+                      help="Comma separated list of page sizes.")
+    parser.add_option('-r', '--repeats',
+                      dest='repeats',
+                      type='int',
+                      default=20,
+                      help="Number of parses timed for every page.")
+    (options, args) = parser.parse_args()
+
+    sizes = [int(s) for s in options.sizes.split(",")]
+    print(json.dumps(run(sizes, options.repeats), indent=2))
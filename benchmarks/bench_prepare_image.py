@@ -0,0 +1,137 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""
+Compares the cost of preparing query images with and without draft decoding.
+
+For every image size a synthetic JPEG is generated, and each preparation path
+runs in its own process so that the peak RSS of one does not hide the other.
+Prints the median latency and the peak RSS of every run as JSON.
+"""
+
+from optparse import OptionParser
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+import craftar
+from craftar._recognition import _prepare_image
+
+DEFAULT_MEGAPIXELS = "2,12,24,48"
+
+
+def make_image(path, megapixels):
+    "Write a 4:3 JPEG of @megapixels with some texture to decode"
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.new("RGB", (width, height), (120, 130, 140))
+    draw = ImageDraw.Draw(image)
+    rand = random.Random(megapixels)
+    for _ in range(2000):
+        x, y = rand.randrange(width), rand.randrange(height)
+        size = rand.randrange(10, max(11, width // 10))
+        color = tuple(rand.randrange(256) for _ in range(3))
+        draw.rectangle((x, y, x + size, y + size), fill=color)
+    image.save(path, "JPEG", quality=90)
+
+
+def peak_rss():
+    """Return the peak RSS of this process, in kilobytes (in bytes on Mac OS
+    X, where it is taken from ru_maxrss)"""
+    # not ru_maxrss where VmHWM is available: it is kept through exec, and
+    # would be the peak of the parent, which has just generated the image
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(path, draft, repeats, color, min_size):
+    "Prepare @path @repeats times and print the timings as JSON"
+    craftar.settings.QUERY_DRAFT_DECODE = draft
+    timings = []
+    for _ in range(repeats):
+        start = time.time()
+        payload = _prepare_image(path, color, min_size, verbose=False)
+        timings.append(1000 * (time.time() - start))
+    timings.sort()
+    print(json.dumps({
+        "median_ms": timings[len(timings) // 2],
+        "min_ms": timings[0],
+        "peak_rss": peak_rss(),
+        "payload_bytes": len(payload),
+    }))
+
+
+def run(megapixels_list, repeats, color, min_size):
+    results = []
+    directory = tempfile.mkdtemp(prefix="craftar-bench-")
+    for megapixels in megapixels_list:
+        path = os.path.join(directory, "query-%smp.jpg" % megapixels)
+        make_image(path, megapixels)
+        for draft in (False, True):
+            output = subprocess.check_output([
+                sys.executable, __file__, "--child", path,
+                "--draft", draft and "1" or "0", "--repeats", str(repeats),
+                "--size", str(min_size)] + (color and ["--color"] or []))
+            result = json.loads(output.decode("utf-8").splitlines()[-1])
+            result.update({
+                "benchmark": "prepare_image",
+                "megapixels": megapixels,
+                "draft": draft,
+                "color": color,
+                "min_size": min_size,
+                "file_bytes": os.path.getsize(path),
+            })
+            results.append(result)
+        os.remove(path)
+    os.rmdir(directory)
+    return results
+
+
+if __name__ == '__main__':
+    usage = "usage: %prog [-m MEGAPIXELS] [-r REPEATS] [-s MIN_SIZE] [-c]"
+    parser = OptionParser(usage)
+    parser.add_option('-m', '--megapixels',
+                      dest='megapixels',
+                      default=DEFAULT_MEGAPIXELS,
+                      help="Comma separated list of image sizes, in MP.")
+    parser.add_option('-r', '--repeats',
+                      dest='repeats',
+                      type='int',
+                      default=5,
+                      help="Number of preparations timed for every image.")
+    parser.add_option('-s', '--size',
+                      dest='min_size',
+                      type='int',
+                      default=craftar.settings.DEFAULT_QUERY_MIN_SIZE,
+                      help="Shorter dimension of the prepared query.")
+    parser.add_option('-c', '--color',
+                      action='store_true',
+                      dest='color',
+                      default=False,
+                      help="Disables grayscale conversion.")
+    parser.add_option('--child', dest='child', help="Internal use.")
+    parser.add_option('--draft', dest='draft', help="Internal use.")
+    (options, args) = parser.parse_args()
+
+    if options.child:
+        run_child(options.child, options.draft == "1", options.repeats,
+                  options.color, options.min_size)
+    else:
+        megapixels_list = [float(m) for m in options.megapixels.split(",")]
+        print(json.dumps(run(megapixels_list, options.repeats, options.color,
+                             options.min_size), indent=2))
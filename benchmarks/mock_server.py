@@ -0,0 +1,368 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""
+Local stand-in for the CraftAR APIs, for benchmarking the library offline.
+
+Implements the recognition endpoints (/<version>/search and /<version>/sync,
+whose bundle files are served from /files/<name>) and the management CRUD
+surface (/api/<version>/<object_type>/) for every object type in
+craftar.settings.ALLOWED_OBJECT_TYPES, storing the objects in memory. Every
+request is delayed by an injectable latency, and a fraction of them by a
+longer one, to simulate a slow tail.
+
+It can run on its own, e.g. to point craftar_search at it:
+
+    python benchmarks/mock_server.py -p 8080 -l 0.05
+"""
+
+from optparse import OptionParser
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid as uuid_module
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+    from email import message_from_bytes as _message_from_bytes
+except ImportError:
+    # Fallback to maintain backward compatibility with Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+    from email import message_from_string as _message_from_bytes
+
+from craftar import settings
+
+MANAGEMENT_PATH = re.compile(r"^/api/(?P<version>\w+)/(?P<object_type>\w+)/"
+                             r"(?:(?P<uuid>[0-9a-fA-F]+)/)?$")
+
+SEARCH_RESPONSE = {
+    "results": [{
+        "item": {"uuid": "0" * 32, "name": "mock item", "url": None,
+                 "custom": None},
+        "image": {"uuid": "1" * 32, "thumb_120": None},
+        "score": 42,
+    }],
+    "search_time": 1,
+}
+
+
+class MockServer(object):
+    """CraftAR stand-in listening on localhost.
+
+    Arguments:
+      latency       - Seconds every request is delayed by.
+      port          - Port to listen on, 0 picks a free one.
+      slow_fraction - Fraction of the requests delayed by @slow_latency
+                      instead.
+      slow_latency  - Seconds the slow requests are delayed by.
+    """
+
+    def __init__(self, latency=0.0, port=0, slow_fraction=0.0,
+                 slow_latency=0.0):
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.objects = {}  # object_type -> {uuid: object}
+        self.files = {}  # name -> content, downloaded from /files/<name>
+        self.cuts = {}  # name -> downloads of the file to cut midway
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = _ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def start(self):
+        "Serve on a background thread, pointing craftar's settings at it"
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        settings.RECOGNITION_HOSTNAME = self.url
+        settings.MANAGEMENT_HOSTNAME = self.url
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_object(self, object_type, data):
+        "Store a new object of @object_type and return it"
+        uuid = uuid_module.uuid4().hex
+        if object_type == "token":
+            uuid = uuid[:16]
+        new_object = dict(data)
+        new_object["uuid"] = uuid
+        new_object["resource_uri"] = "/api/%s/%s/%s/" % (
+            settings.MANAGEMENT_API_VERSION, object_type, uuid)
+        if object_type == "token":
+            new_object["token"] = uuid
+        new_object.setdefault("name", "%s %s" % (object_type, uuid[:8]))
+        self.touch(new_object)
+        with self.lock:
+            self.objects.setdefault(object_type, {})[uuid] = new_object
+        return new_object
+
+    def add_file(self, name, content):
+        "Serve @content as a bundle file returned by sync, return its url"
+        self.files[name] = content
+        return "%s/files/%s" % (self.url, name)
+
+    def cut(self, name, times=1):
+        """Close the connection halfway through the body of the next @times
+        downloads of the file @name"""
+        with self.lock:
+            self.cuts[name] = times
+
+    def list_objects(self, object_type, query):
+        "Return the objects of @object_type matching the @query filters"
+        with self.lock:
+            object_list = list(self.objects.get(object_type, {}).values())
+        for key, values in query.items():
+            if key.endswith("__uuid"):
+                path = key[:-len("__uuid")].split("__")
+                object_list = [o for o in object_list
+                               if self._related_uuid(o, path) == values[0]]
+            elif key.endswith("__gte"):
+                field = key[:-len("__gte")]
+                object_list = [o for o in object_list
+                               if o.get(field, "") >= values[0]]
+        return object_list
+
+    def _related_uuid(self, found, path):
+        "Return the uuid of the object @found refers to through @path"
+        for field in path:
+            uri = found.get(field) or ""
+            parts = uri.split("/")
+            if len(parts) < 3:
+                return None
+            found = self.objects.get(parts[-3], {}).get(parts[-2]) or {}
+            uuid = parts[-2]
+        return uuid
+
+    def touch(self, found):
+        "Update the modification date of the object @found"
+        found["modification_date"] = time.strftime("%Y-%m-%dT%H:%M:%S") + \
+            ".%06d" % (time.time() % 1 * 1e6)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send headers and body together, delayed ACKs would add 40ms otherwise
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _send(self, status, body=None, etag=None):
+        content = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, method):
+        body = self._read_body()
+        with self.mock.lock:
+            self.mock.requests += 1
+        latency = self.mock.latency
+        if self.mock.slow_fraction and \
+                random.random() < self.mock.slow_fraction:
+            latency = self.mock.slow_latency
+        if latency:
+            time.sleep(latency)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if method == "POST" and url.path.endswith("/search"):
+            return self._send(200, SEARCH_RESPONSE)
+        if method == "POST" and url.path.endswith("/sync"):
+            return self._send(200, {"bundles": [
+                {"url": "%s/files/%s" % (self.mock.url, name),
+                 "md5": hashlib.md5(content).hexdigest()}
+                for name, content in sorted(self.mock.files.items())]})
+        if method == "GET" and url.path.startswith("/files/"):
+            return self._send_file(url.path[len("/files/"):])
+
+        match = MANAGEMENT_PATH.match(url.path)
+        if not match or "api_key" not in query or \
+                match.group("object_type") not in \
+                settings.ALLOWED_OBJECT_TYPES:
+            return self._send(404, {"error": {"code": "NOT_FOUND",
+                                              "message": "Not found"}})
+        object_type, uuid = match.group("object_type", "uuid")
+
+        if uuid is None and method == "GET":
+            return self._send_list(object_type, query)
+        if uuid is None and method == "POST":
+            if self.headers.get("Content-Type", "").startswith("multipart"):
+                data = _form_fields(self.headers["Content-Type"], body)
+                data.update({"name": "%s upload" % object_type,
+                             "size": len(body)})
+            else:
+                data = json.loads(body.decode("utf-8"))
+            return self._send(201, self.mock.add_object(object_type, data))
+
+        found = self.mock.objects.get(object_type, {}).get(uuid)
+        if found is None:
+            return self._send(404, {"error": {"code": "NOT_FOUND",
+                                              "message": "Not found"}})
+        if method == "GET":
+            return self._send_cached(found)
+        if method == "PUT":
+            if not self.headers.get("Content-Type", "").startswith(
+                    "multipart"):
+                found.update(json.loads(body.decode("utf-8")))
+            self.mock.touch(found)
+            return self._send(202, found)
+        if method == "DELETE":
+            with self.mock.lock:
+                del self.mock.objects[object_type][uuid]
+            return self._send(204)
+
+    def _send_file(self, name):
+        "Send a bundle file, or the range of it requested"
+        content = self.mock.files.get(name)
+        if content is None:
+            return self._send(404, {"error": {"code": "NOT_FOUND",
+                                              "message": "Not found"}})
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, etag=etag)
+        status, start = 200, 0
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            start = int(match.group(1))
+            if start >= len(content):
+                return self._send(416)
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content) - start))
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (
+                start, len(content) - 1, len(content)))
+        self.end_headers()
+        end = len(content)
+        with self.mock.lock:
+            if self.mock.cuts.get(name):
+                self.mock.cuts[name] -= 1
+                end = start + (end - start) // 2
+        self.wfile.write(content[start:end])
+        if end < len(content):
+            self.close_connection = True
+
+    def _send_list(self, object_type, query):
+        object_list = self.mock.list_objects(object_type, query)
+        limit = int(query.get("limit", ["20"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        page = object_list[offset:offset + limit]
+        next_page = None
+        if offset + limit < len(object_list):
+            next_page = "?limit=%d&offset=%d" % (limit, offset + limit)
+        self._send_cached({
+            "meta": {"limit": limit, "offset": offset,
+                     "total_count": len(object_list), "next": next_page,
+                     "previous": None},
+            "objects": page,
+        })
+
+    def _send_cached(self, body):
+        "Send @body, or 304 if the client already has it"
+        etag = '"%s"' % hashlib.md5(
+            json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, etag=etag)
+        return self._send(200, body, etag=etag)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def _form_fields(content_type, body):
+    "Return the text fields of a multipart/form-data @body"
+    message = _message_from_bytes(
+        b"Content-Type: " + content_type.encode("utf-8") + b"\r\n\r\n" + body)
+    return dict((part.get_param("name", header="content-disposition"),
+                 part.get_payload(decode=True).decode("utf-8"))
+                for part in message.get_payload()
+                if part.get_filename() is None)
+
+
+if __name__ == '__main__':
+    usage = "usage: %prog [-p PORT] [-l LATENCY] [-f FRACTION -L LATENCY]"
+    parser = OptionParser(usage)
+    parser.add_option('-p', '--port',
+                      dest='port',
+                      type='int',
+                      default=8080,
+                      help="Port to listen on.")
+    parser.add_option('-l', '--latency',
+                      dest='latency',
+                      type='float',
+                      default=0.0,
+                      help="Seconds every request is delayed by.")
+    parser.add_option('-f', '--slow-fraction',
+                      dest='slow_fraction',
+                      type='float',
+                      default=0.0,
+                      help="Fraction of the requests delayed by "
+                           "--slow-latency instead.")
+    parser.add_option('-L', '--slow-latency',
+                      dest='slow_latency',
+                      type='float',
+                      default=0.0,
+                      help="Seconds the slow requests are delayed by.")
+    (options, args) = parser.parse_args()
+
+    server = MockServer(options.latency, options.port, options.slow_fraction,
+                        options.slow_latency)
+    print("Serving the CraftAR APIs at %s" % server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,246 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""
+Runs the benchmark suite of the library against a local mock CraftAR server.
+
+Measures the cost of importing the library, of preparing query images by
+size, of parsing large list responses, single and concurrent search
+throughput, the tail latency of hedged searches, paginated listing and bulk
+upload. The results are printed (or written with -o) as JSON, so runs of
+different releases can be compared to catch regressions.
+"""
+
+from optparse import OptionParser
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+import craftar
+from craftar._instrumentation import _percentile
+from craftar._recognition import _prepare_image
+from bench_import import run as bench_import
+from bench_parse import run as bench_parse
+from bench_prepare_image import make_image
+from mock_server import MockServer
+
+
+def timings_summary(timings):
+    "Return the latency statistics of @timings, in milliseconds"
+    timings = sorted(1000 * t for t in timings)
+    return {
+        "mean_ms": sum(timings) / len(timings),
+        "p50_ms": _percentile(timings, 50),
+        "p90_ms": _percentile(timings, 90),
+        "p99_ms": _percentile(timings, 99),
+        "max_ms": max(timings),
+    }
+
+
+def bench_prepare_image(directory, megapixels_list, repeats):
+    results = []
+    for megapixels in megapixels_list:
+        path = os.path.join(directory, "query-%smp.jpg" % megapixels)
+        make_image(path, megapixels)
+        timings = []
+        for _ in range(repeats):
+            start = time.time()
+            _prepare_image(path, verbose=False)
+            timings.append(time.time() - start)
+        result = {"benchmark": "prepare_image", "megapixels": megapixels}
+        result.update(timings_summary(timings))
+        results.append(result)
+    return results
+
+
+def bench_search(query, requests, concurrency_list):
+    "Search the same prepared @query, serially and concurrently"
+    results = []
+    timings = []
+    start = time.time()
+    for _ in range(requests):
+        request_start = time.time()
+        craftar.search("0" * 16, query, color=True, min_size=-1)
+        timings.append(time.time() - request_start)
+    result = {"benchmark": "search", "concurrency": 1,
+              "requests": requests,
+              "requests_per_sec": requests / (time.time() - start)}
+    result.update(timings_summary(timings))
+    results.append(result)
+
+    for concurrency in concurrency_list:
+        start = time.time()
+        timings = [r.elapsed for r in craftar.search_many(
+            "0" * 16, [query] * requests, concurrency=concurrency,
+            processes=0, color=True, min_size=-1) if r.error is None]
+        result = {"benchmark": "search_many", "concurrency": concurrency,
+                  "requests": requests,
+                  "requests_per_sec": requests / (time.time() - start)}
+        result.update(timings_summary(timings))
+        results.append(result)
+    return results
+
+
+def bench_hedging(server, query, requests, slow_fraction):
+    """Search serially with and without hedging, while a @slow_fraction of
+    the requests are 10 times slower"""
+    server.slow_fraction = slow_fraction
+    server.slow_latency = 10 * server.latency
+    results = []
+    try:
+        for hedger in (None, craftar.Hedger(percentile=90, max_extra=0.1)):
+            timings = []
+            for _ in range(requests):
+                request_start = time.time()
+                craftar.search("0" * 16, query, color=True, min_size=-1,
+                               hedger=hedger)
+                timings.append(time.time() - request_start)
+            result = {"benchmark": "search_hedged" if hedger else "search",
+                      "requests": requests, "slow_fraction": slow_fraction,
+                      "hedged": hedger and hedger.hedged or 0}
+            result.update(timings_summary(timings))
+            results.append(result)
+    finally:
+        server.slow_fraction = 0.0
+    return results
+
+
+def bench_listing(server, item_count, page_size, concurrency):
+    collection = server.add_object("collection", {"name": "listing"})
+    for i in range(item_count):
+        server.add_object("item", {"name": "item %d" % i,
+                                   "collection": collection["resource_uri"]})
+    results = []
+
+    start = time.time()
+    count = len(list(craftar.iter_items("key", collection["uuid"],
+                                        page_size=page_size)))
+    results.append({"benchmark": "iter_items", "items": count,
+                    "page_size": page_size,
+                    "seconds": time.time() - start})
+
+    start = time.time()
+    count = len(craftar.list_all("key", "item", collection["uuid"],
+                                 page_size=page_size,
+                                 concurrency=concurrency))
+    results.append({"benchmark": "list_all", "items": count,
+                    "page_size": page_size, "concurrency": concurrency,
+                    "seconds": time.time() - start})
+    return results
+
+
+def bench_upload(directory, image_count, workers):
+    upload_directory = os.path.join(directory, "upload")
+    os.mkdir(upload_directory)
+    for i in range(image_count):
+        Image.new("RGB", (640, 480), (i % 256, 80, 160)).save(
+            os.path.join(upload_directory, "image-%d.jpg" % i), "JPEG")
+    _, stats = craftar.upload_directory("key", upload_directory,
+                                        workers=workers)
+    return [{"benchmark": "upload_directory", "workers": workers,
+             "images": stats.images_uploaded, "errors": len(stats.errors),
+             "seconds": stats.elapsed,
+             "images_per_sec": stats.images_per_second}]
+
+
+def run(options):
+    directory = tempfile.mkdtemp(prefix="craftar-bench-")
+    server = MockServer(latency=options.latency).start()
+    craftar.set_client(craftar.Client(pool_maxsize=max(options.concurrency)))
+    try:
+        results = bench_import(3)
+        results += bench_prepare_image(directory, options.megapixels,
+                                      options.repeats)
+        query = _prepare_image(os.path.join(
+            directory, "query-%smp.jpg" % options.megapixels[0]),
+            verbose=False)
+        results += bench_parse([1000], options.repeats)
+        results += bench_search(query, options.requests, options.concurrency)
+        results += bench_hedging(server, query, options.requests,
+                                 options.slow_fraction)
+        results += bench_listing(server, options.items, options.page_size,
+                                 max(options.concurrency))
+        results += bench_upload(directory, options.images,
+                                max(options.concurrency))
+    finally:
+        craftar.set_client(None).close()
+        server.stop()
+        shutil.rmtree(directory)
+
+    return {
+        "user_agent": craftar.settings.USER_AGENT,
+        "platform": platform.platform(),
+        "latency": options.latency,
+        "time": time.time(),
+        "server_requests": server.requests,
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    usage = "usage: %prog [-o OUTPUT] [-l LATENCY] [options]"
+    parser = OptionParser(usage)
+    parser.add_option('-o', '--output',
+                      dest='output',
+                      help="Write the JSON results to this file.")
+    parser.add_option('-l', '--latency',
+                      dest='latency',
+                      type='float',
+                      default=0.02,
+                      help="Seconds the mock server delays every request.")
+    parser.add_option('-m', '--megapixels',
+                      dest='megapixels',
+                      default="1,12",
+                      help="Comma separated sizes of the prepared images.")
+    parser.add_option('-r', '--repeats',
+                      dest='repeats',
+                      type='int',
+                      default=5,
+                      help="Preparations timed for every image size.")
+    parser.add_option('-n', '--requests',
+                      dest='requests',
+                      type='int',
+                      default=100,
+                      help="Search requests per benchmark.")
+    parser.add_option('-c', '--concurrency',
+                      dest='concurrency',
+                      default="4,16",
+                      help="Comma separated concurrency levels.")
+    parser.add_option('-f', '--slow-fraction',
+                      dest='slow_fraction',
+                      type='float',
+                      default=0.05,
+                      help="Fraction of slow requests in the hedging "
+                           "benchmark.")
+    parser.add_option('-i', '--items',
+                      dest='items',
+                      type='int',
+                      default=2000,
+                      help="Items in the listed collection.")
+    parser.add_option('-p', '--page-size',
+                      dest='page_size',
+                      type='int',
+                      default=100,
+                      help="Page size of the listings.")
+    parser.add_option('-u', '--images',
+                      dest='images',
+                      type='int',
+                      default=100,
+                      help="Images uploaded in bulk.")
+    (options, args) = parser.parse_args()
+    options.megapixels = [float(m) for m in options.megapixels.split(",")]
+    options.concurrency = [int(c) for c in options.concurrency.split(",")]
+
+    report = json.dumps(run(options), indent=2)
+    if options.output:
+        with open(options.output, "w") as output:
+            output.write(report)
+    else:
+        print(report)
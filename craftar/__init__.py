@@ -3,7 +3,81 @@
 #  https://github.com/catchoom/craftar-python/blob/master/LICENSE
 #  All warranties and liabilities are disclaimed.
 
-"Provides access to the CraftAR API"
+"""Provides access to the CraftAR API
 
-from craftar._recognition import search, sync
-from craftar._management import *
+The functions and classes of the package are loaded on first use, so that
+importing it doesn't import requests, Pillow or any module that is not
+used, e.g. by scripts using only the management API.
+"""
+
+import importlib
+import sys
+
+from craftar import settings
+
+# module -> public names it provides
+_LAZY_IMPORTS = {
+    "craftar._cache": (
+        "SearchCache", "MemorySearchBackend", "SQLiteSearchBackend",
+        "ObjectCache", "PreparedCache"),
+    "craftar._instrumentation": (
+        "add_hook", "remove_hook", "Event", "StatsdExporter",
+        "PrometheusExporter"),
+    "craftar._coalesce": ("Coalescer",),
+    "craftar._client": ("Client", "RateLimiter", "get_client", "set_client"),
+    "craftar._hedging": ("Hedger",),
+    "craftar._exceptions": (
+        "CraftARError", "APIError", "ClientError", "NotFoundError",
+        "RateLimitError", "ServerError"),
+    "craftar._recognition": ("search", "search_many", "sync"),
+    "craftar._management": (
+        "get_collection_list", "iter_collections", "get_collection",
+        "create_collection", "update_collection", "delete_collection",
+        "get_item_list", "iter_items", "get_item", "create_item",
+        "update_item", "delete_item",
+        "get_image_list", "iter_images", "get_image", "create_image",
+        "update_image", "delete_image",
+        "get_token_list", "iter_tokens", "create_token", "update_token",
+        "delete_token",
+        "get_media_list", "iter_media", "get_media", "create_media",
+        "create_video_media", "delete_media",
+        "get_tag_list", "iter_tags", "get_tag", "create_tag", "delete_tag",
+        "get_app_list", "iter_apps", "get_app", "create_app",
+        "get_version_list", "iter_versions", "get_version",
+        "get_bundle_list", "iter_bundles", "get_bundle", "create_bundle",
+        "delete_bundle",
+        "list_all", "BulkResult", "BulkReport", "bulk_create_items",
+        "bulk_update_items", "bulk_create_images", "bulk_delete"),
+    "craftar._mirror": ("CollectionMirror",),
+    "craftar._stream": ("StreamRecognizer", "StreamResult"),
+    "craftar._sync": ("sync_bundles", "BundleStore", "BundleFile"),
+    "craftar._upload": ("upload_directory", "UploadJournal", "UploadStats"),
+}
+
+# public name -> module providing it
+_LAZY_MODULES = dict((name, module)
+                     for module, names in _LAZY_IMPORTS.items()
+                     for name in names)
+
+__all__ = ["settings"] + sorted(_LAZY_MODULES)
+
+
+def __getattr__(name):
+    "Import the module providing @name on first use"
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError("module 'craftar' has no attribute '%s'" % name)
+    value = getattr(importlib.import_module(module), name)
+    # so that later uses don't go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ (PEP 562), everything is imported up front
+    for _name in _LAZY_MODULES:
+        __getattr__(_name)
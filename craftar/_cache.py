@@ -0,0 +1,428 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the caches of recognition results and management objects.
+
+Recognition results are keyed by the token, the search options and a
+perceptual hash of the prepared query image, so near-identical queries (e.g.
+repeated scans of the same poster) are answered without a round trip.
+
+Management objects and lists are cached by url, and revalidated with their
+ETag once expired, so that an unchanged object costs a 304 response instead
+of its full body.
+
+Prepared query images are cached on disk by file and preparation options, so
+that querying the same files again skips decoding and encoding them.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+
+
+class SearchCache(object):
+    """Cache of recognition results, used through search(..., cache=cache).
+
+    Arguments:
+      threshold - Maximum Hamming distance between the 64 bit perceptual
+                  hashes of two queries considered the same. 0 only matches
+                  queries preparing to the very same image.
+      backend   - Where the results are stored. Defaults to a
+                  MemorySearchBackend.
+    """
+
+    def __init__(self, threshold=4, backend=None):
+        self.threshold = threshold
+        self.backend = backend if backend is not None \
+            else MemorySearchBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, image_hash):
+        "Return the cached response for the query, or None"
+        response = self.backend.find(key, image_hash, self.threshold)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, key, image_hash, response):
+        "Store the response of a query, unless it is an error"
+        if "error" not in response:
+            self.backend.add(key, image_hash, response)
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+class MemorySearchBackend(object):
+    """Stores recognition results in memory.
+
+    Arguments:
+      max_entries - Number of results kept, the least recently used ones
+                    are evicted first.
+      ttl         - Seconds a result is valid for, None for no expiry.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # (key, hash) -> entry
+        self._lock = threading.Lock()
+
+    def find(self, key, image_hash, threshold):
+        now = time.time()
+        with self._lock:
+            found = None
+            if (key, image_hash) in self._entries:
+                found = (key, image_hash)
+            elif threshold > 0:
+                for entry_key, entry_hash in self._entries:
+                    if entry_key == key and \
+                            _hamming(entry_hash, image_hash) <= threshold:
+                        found = (entry_key, entry_hash)
+                        break
+            if found is None:
+                return None
+            created, response = self._entries[found]
+            if self.ttl is not None and now - created > self.ttl:
+                del self._entries[found]
+                return None
+            _move_to_end(self._entries, found)
+        return json.loads(response)
+
+    def add(self, key, image_hash, response):
+        with self._lock:
+            self._entries.pop((key, image_hash), None)
+            self._entries[(key, image_hash)] = (time.time(),
+                                                json.dumps(response))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteSearchBackend(object):
+    """Stores recognition results in a SQLite database on disk, so they are
+    kept between runs and can be shared by several processes.
+
+    Arguments:
+      path        - Path to the database, created if missing.
+      max_entries - Number of results kept, the least recently used ones
+                    are evicted first.
+      ttl         - Seconds a result is valid for, None for no expiry.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT NOT NULL, hash INTEGER NOT NULL,
+                    response TEXT NOT NULL, created REAL NOT NULL,
+                    used REAL NOT NULL, PRIMARY KEY (key, hash))""")
+            self._connection.execute("""
+                CREATE INDEX IF NOT EXISTS search_cache_used
+                ON search_cache (used)""")
+
+    def find(self, key, image_hash, threshold):
+        now = time.time()
+        min_created = now - self.ttl if self.ttl is not None else 0
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT hash, response FROM search_cache "
+                "WHERE key = ? AND created >= ?",
+                (key, min_created)).fetchall()
+            for entry_hash, response in rows:
+                # hashes are stored as signed 64 bit integers
+                if _hamming(entry_hash & 0xffffffffffffffff,
+                            image_hash) <= threshold:
+                    with self._connection:
+                        self._connection.execute(
+                            "UPDATE search_cache SET used = ? "
+                            "WHERE key = ? AND hash = ?",
+                            (now, key, entry_hash))
+                    return json.loads(response)
+        return None
+
+    def add(self, key, image_hash, response):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                (key, _signed(image_hash), json.dumps(response), now, now))
+            if self.ttl is not None:
+                self._connection.execute(
+                    "DELETE FROM search_cache WHERE created < ?",
+                    (now - self.ttl,))
+            self._connection.execute(
+                "DELETE FROM search_cache WHERE rowid IN (SELECT rowid "
+                "FROM search_cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM search_cache")
+
+
+class ObjectCache(object):
+    """Read-through cache of the management API GET requests, used through
+    Client(cache=cache). Writes through the same client invalidate the
+    written object and the cached lists.
+
+    Arguments:
+      max_entries - Number of responses kept, the least recently used ones
+                    are evicted first.
+      ttl         - Seconds a response is used without asking the API.
+                    Expired responses with an ETag are revalidated with an
+                    If-None-Match request.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0  # misses answered with a 304 response
+        self._entries = collections.OrderedDict()  # url -> _ObjectEntry
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        "Return the entry cached for @url, fresh or not, or None"
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                _move_to_end(self._entries, url)
+            return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.fetched < self.ttl
+
+    def count(self, hit=False, revalidated=False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if revalidated:
+                    self.revalidations += 1
+
+    def set(self, url, object_type, uuid, etag, content):
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = _ObjectEntry(object_type, uuid, etag,
+                                              content, time.time())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, url):
+        "Mark the entry for @url as fresh again, after a revalidation"
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                entry.fetched = time.time()
+
+    def invalidate(self, object_type=None, uuid=None):
+        """Remove the lists of @object_type and the object @uuid.
+        Without @object_type, all the lists are removed."""
+        with self._lock:
+            for url, entry in list(self._entries.items()):
+                if entry.uuid is None:
+                    stale = object_type is None or \
+                        entry.object_type == object_type
+                else:
+                    stale = uuid is not None and entry.uuid == uuid and \
+                        entry.object_type == object_type
+                if stale:
+                    del self._entries[url]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.revalidations = 0
+
+
+class PreparedCache(object):
+    """Cache of prepared query images on disk, used through
+    search(..., prepared_cache=cache). Queries are keyed by the path,
+    modification time and size of their file and the preparation options,
+    so an edited file is prepared again. Queries that are not files are
+    never cached.
+
+    The cache is a SQLite database, which can be shared by several processes.
+    The worker processes of search_many open it once each, and their hits
+    and misses are added to the counters of this instance.
+
+    Arguments:
+      path      - Path to the database, created if missing.
+      max_bytes - Total size of the cached queries, the least recently used
+                  ones are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def __reduce__(self):
+        # sent to other processes without the connection, each of them
+        # opens the database once, not for every query it prepares
+        return _process_prepared_cache, (self.path, self.max_bytes)
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         check_same_thread=False)
+            connection.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS prepared_cache (
+                    key TEXT PRIMARY KEY, payload BLOB NOT NULL,
+                    size INTEGER NOT NULL, used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS prepared_cache_used
+                    ON prepared_cache (used);
+            """)
+            self._connection = connection
+        return self._connection
+
+    def key(self, filename, *options):
+        "Return the key of the file @filename prepared with @options"
+        stat = os.stat(filename)
+        return json.dumps([os.path.abspath(filename), stat.st_mtime,
+                           stat.st_size] + list(options))
+
+    def get(self, key):
+        "Return the prepared query stored under @key, or None"
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT payload FROM prepared_cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with connection:
+                connection.execute(
+                    "UPDATE prepared_cache SET used = ? WHERE key = ?",
+                    (time.time(), key))
+        return bytes(row[0])
+
+    def set(self, key, payload):
+        "Store the prepared query @payload, evicting old ones if needed"
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO prepared_cache "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(payload), len(payload), time.time()))
+                total = connection.execute(
+                    "SELECT SUM(size) FROM prepared_cache").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                for old_key, size in connection.execute(
+                        "SELECT key, size FROM prepared_cache "
+                        "ORDER BY used").fetchall():
+                    connection.execute(
+                        "DELETE FROM prepared_cache WHERE key = ?",
+                        (old_key,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM prepared_cache")
+            self.hits = self.misses = 0
+
+    def _count(self, hits, misses):
+        "Add the @hits and @misses counted by another process"
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# (path, max_bytes) -> PreparedCache unpickled in this process
+_process_prepared_caches = {}
+
+
+def _process_prepared_cache(path, max_bytes):
+    "Return the PreparedCache of the database @path for this process"
+    key = (path, max_bytes)
+    cache = _process_prepared_caches.get(key)
+    if cache is None:
+        cache = _process_prepared_caches[key] = PreparedCache(path,
+                                                              max_bytes)
+    return cache
+
+
+class _ObjectEntry(object):
+    "A cached response of the management API"
+
+    def __init__(self, object_type, uuid, etag, content, fetched):
+        self.object_type = object_type
+        self.uuid = uuid  # None for lists
+        self.etag = etag
+        self.content = content
+        self.fetched = fetched
+
+
+def _search_key(token, *options):
+    "Return the cache key of a query to @token with the given @options"
+    return json.dumps([token] + list(options))
+
+
+def _image_hash(image):
+    "Return the 64 bit difference hash of the prepared query @image"
+    from PIL import Image  # loaded by the first query hashed
+    if not isinstance(image, Image.Image):
+        image = Image.open(BytesIO(image))
+        image.draft("L", (9, 8))
+    pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    image_hash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            image_hash = (image_hash << 1) | (left > pixels[row * 9 + col + 1])
+    return image_hash
+
+
+def _hamming(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def _signed(image_hash):
+    return image_hash - (1 << 64) if image_hash >= (1 << 63) else image_hash
+
+
+def _move_to_end(ordered_dict, key):
+    # OrderedDict.move_to_end is not available in python 2
+    ordered_dict[key] = ordered_dict.pop(key)
@@ -0,0 +1,309 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the HTTP client shared by all the calls to CraftAR's APIs.
+
+A client owns a pooled, keep-alive ``requests.Session``, so consecutive calls
+to the same host reuse an open connection instead of performing a new TCP and
+TLS handshake every time. The module-level functions of the library use the
+default client, which can be replaced with set_client().
+
+Every request goes through the scheduler of its client: an optional token
+bucket limits the rate of requests, and transient errors (429 and 5xx
+responses, connection failures) are retried with exponential backoff and
+jitter, waiting as told by the Retry-After header if present. Requests time
+out if the server doesn't accept the connection or stops answering.
+Optionally, identical requests sent by several threads at the same time are
+coalesced into one.
+"""
+
+import itertools
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from craftar import settings
+from craftar import _instrumentation
+from craftar._coalesce import Coalescer, _request_key
+from craftar._exceptions import _retry_after
+
+# methods that can be sent again without side effects
+_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# methods coalesced by default, when the client coalesces requests
+_COALESCED_METHODS = ('GET', 'HEAD')
+# statuses of failed requests worth sending again, when idempotent or not
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_RETRY_STATUSES_UNSAFE = (429, 503)
+
+
+class Client(object):
+    """HTTP client holding a pool of keep-alive connections per host.
+
+    Arguments:
+      pool_connections - Number of hosts to keep connection pools for.
+                         Defaults to settings.POOL_CONNECTIONS.
+      pool_maxsize     - Maximum number of connections kept open per host.
+                         Use at least the number of threads sharing the
+                         client, otherwise extra connections are discarded.
+                         Defaults to settings.POOL_MAXSIZE.
+      cache            - ObjectCache for the management API GET requests.
+                         None (the default) disables caching.
+      max_retries      - Number of retries of a request failing with a
+                         transient error. Defaults to settings.MAX_RETRIES.
+      rate_limit       - Maximum number of requests per second sent by all
+                         the threads sharing the client. Defaults to
+                         settings.RATE_LIMIT.
+      connect_timeout  - Seconds to wait for a connection to be established.
+                         Defaults to settings.CONNECT_TIMEOUT.
+      read_timeout     - Seconds to wait for the server between two reads
+                         of a response. Defaults to settings.READ_TIMEOUT.
+      coalesce         - Whether identical GET requests (and searches) sent
+                         while the same one is in flight share its response
+                         instead of being sent. The number of calls merged
+                         is counted by the client's coalescer. Defaults to
+                         settings.COALESCE_REQUESTS.
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, cache=None,
+                 max_retries=None, rate_limit=None, connect_timeout=None,
+                 read_timeout=None, coalesce=None):
+        if pool_connections is None:
+            pool_connections = settings.POOL_CONNECTIONS
+        if pool_maxsize is None:
+            pool_maxsize = settings.POOL_MAXSIZE
+        if max_retries is None:
+            max_retries = settings.MAX_RETRIES
+        if rate_limit is None:
+            rate_limit = settings.RATE_LIMIT
+        if connect_timeout is None:
+            connect_timeout = settings.CONNECT_TIMEOUT
+        if read_timeout is None:
+            read_timeout = settings.READ_TIMEOUT
+        if coalesce is None:
+            coalesce = settings.COALESCE_REQUESTS
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.cache = cache
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = RateLimiter(rate_limit, settings.RATE_LIMIT_BURST)
+        self.coalescer = Coalescer() if coalesce else None
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = settings.USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, retries=None, idempotent=None,
+                coalesce=None, **kwargs):
+        """Send a request through the pooled session, retrying it on
+        transient errors.
+
+        Arguments:
+          retries    - Number of retries, defaults to the client's
+                       max_retries.
+          idempotent - Whether the request can be sent twice without side
+                       effects. Defaults to True for every method but POST
+                       and PATCH. Requests that are not idempotent are only
+                       retried on 429 and 503 responses, which the API sends
+                       without processing them.
+          coalesce   - Whether the request can share the response of an
+                       identical one in flight, if the client coalesces
+                       requests. Defaults to True for GET and HEAD.
+                       Streamed requests and requests sending files from
+                       disk are never coalesced.
+
+        The timeout keyword, as in requests, defaults to the client's
+        (connect_timeout, read_timeout).
+        """
+        if retries is None:
+            retries = self.max_retries
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.coalescer is not None:
+            if coalesce is None:
+                coalesce = method.upper() in _COALESCED_METHODS
+            key = coalesce and _request_key(method, url, kwargs)
+            if key:
+                return self.coalescer.call(key, self._request, method, url,
+                                           retries, idempotent, **kwargs)
+        return self._request(method, url, retries, idempotent, **kwargs)
+
+    def _request(self, method, url, retries, idempotent, **kwargs):
+        if idempotent is None:
+            idempotent = method.upper() in _IDEMPOTENT_METHODS
+        if idempotent:
+            statuses = _RETRY_STATUSES
+            errors = (requests.ConnectionError, requests.Timeout)
+        else:
+            # a request that failed to connect was never sent
+            statuses = _RETRY_STATUSES_UNSAFE
+            errors = requests.ConnectTimeout
+        positions = _file_positions(kwargs)
+
+        for attempt in itertools.count():
+            self.rate_limiter.acquire()
+            try:
+                response = self._send(method, url, attempt, **kwargs)
+            except errors:
+                if attempt >= retries:
+                    raise
+                delay = _backoff(attempt)
+            else:
+                if attempt >= retries or \
+                        response.status_code not in statuses:
+                    return response
+                retry_after = _retry_after(response)
+                delay = _backoff(attempt) if retry_after is None \
+                    else retry_after
+                if response.status_code == 429:
+                    # hold every thread, not only this one
+                    self.rate_limiter.pause(delay)
+                    delay = 0
+                if kwargs.get('stream'):
+                    # release the connection of the unread response
+                    response.close()
+            if delay:
+                time.sleep(delay)
+            _rewind(positions)
+
+    def _send(self, method, url, attempt, **kwargs):
+        if not _instrumentation._hooks:
+            return self.session.request(method, url, **kwargs)
+
+        start_time = _instrumentation._timer()
+        response = self.session.request(method, url, **kwargs)
+        duration = _instrumentation._timer() - start_time
+        body = response.request.body
+        _instrumentation._emit(
+            "http", duration, method=method, url=url.split("?", 1)[0],
+            status_code=response.status_code,
+            request_bytes=len(body) if body is not None else 0,
+            response_bytes=None if kwargs.get('stream') else
+            len(response.content),
+            headers_time=response.elapsed.total_seconds(), attempt=attempt)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        "Close all the pooled connections"
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RateLimiter(object):
+    """Token bucket limiting the rate of the requests of a client, shared by
+    all its threads.
+
+    Arguments:
+      rate  - Requests per second, None for no limit.
+      burst - Number of requests that can be sent at once after a while
+              without sending any.
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        "Wait until a request can be sent"
+        while True:
+            with self._lock:
+                now = time.time()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if not self.rate:
+                        return
+                    self._tokens = min(self.burst, self._tokens +
+                                       (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        "Hold every request for @seconds, e.g. after a 429 response"
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.time() + seconds)
+
+
+def _backoff(attempt):
+    "Return the seconds to wait before a retry, with full jitter"
+    delay = settings.BACKOFF_FACTOR * (2 ** attempt)
+    return random.uniform(0, min(delay, settings.BACKOFF_MAX))
+
+
+def _file_positions(kwargs):
+    "Return the file objects sent in the request with their positions"
+    positions = []
+    files = kwargs.get('files') or {}
+    for value in (files.values() if isinstance(files, dict) else files):
+        if isinstance(value, tuple):
+            # (name, file) or (name, file, content type...) tuples
+            value = value[1] if len(value) > 1 else value[0]
+        if hasattr(value, 'seek') and hasattr(value, 'tell'):
+            positions.append((value, value.tell()))
+    data = kwargs.get('data')
+    if hasattr(data, 'seek') and hasattr(data, 'tell'):
+        positions.append((data, data.tell()))
+    return positions
+
+
+def _rewind(positions):
+    "Move the files read by a failed request back, to send them again"
+    for file_object, position in positions:
+        file_object.seek(position)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    "Return the client used by the module-level functions"
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = Client()
+    return _default_client
+
+
+def set_client(client):
+    """Replace the client used by the module-level functions.
+    Passing None restores a default client on the next call.
+    Return the previous client, which is not closed."""
+    global _default_client
+    with _default_client_lock:
+        previous = _default_client
+        _default_client = client
+    return previous
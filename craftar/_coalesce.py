@@ -0,0 +1,107 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the coalescing of identical requests sent at the same time.
+
+When several threads send the same request (same method, url, headers and
+body) while it is in flight, only the first one is sent and all of them
+share its response.
+"""
+
+import hashlib
+import json
+import threading
+
+from craftar import _instrumentation
+
+
+class Coalescer(object):
+    """Single-flight group of calls, enabled with Client(coalesce=True).
+    Every merged call emits a "coalesced" event, timing its wait.
+
+    Attributes:
+      calls  - Number of calls made through the coalescer.
+      merged - Number of calls that shared the result of another one
+               instead of being made.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.merged = 0
+        self._flights = {}  # key -> _Flight in progress
+        self._lock = threading.Lock()
+
+    def call(self, key, function, *args, **kwargs):
+        """Return function(*args, **kwargs), or the result of the call with
+        the same @key in progress, if any. Errors are shared too."""
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.merged += 1
+        if not leader:
+            start_time = _instrumentation._timer()
+            flight.done.wait()
+            _instrumentation._emit("coalesced",
+                                   _instrumentation._timer() - start_time,
+                                   key=key)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function(*args, **kwargs)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+class _Flight(object):
+    "A call in progress, and its outcome once done"
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _request_key(method, url, kwargs):
+    """Return the key identifying a request sent with the arguments
+    @kwargs of requests, or None if it can't be coalesced: streamed
+    responses, or bodies read from files"""
+    if kwargs.get('stream'):
+        return None
+    digest = hashlib.sha256()
+    for name in ('params', 'headers', 'data', 'json'):
+        value = kwargs.get(name)
+        if isinstance(value, dict):
+            value = sorted((key, item) for key, item in value.items()
+                           if item is not None)
+        if name == 'json':
+            value = json.dumps(value, sort_keys=True)
+        if hasattr(value, 'read'):
+            return None
+        digest.update(repr(value).encode('utf-8'))
+    files = kwargs.get('files') or {}
+    for name, value in sorted(files.items() if isinstance(files, dict)
+                              else files, key=lambda field: field[0]):
+        details = ()
+        if isinstance(value, tuple):
+            # (filename, content) or (filename, content, content type...)
+            details = value[:1] + value[2:]
+            value = value[1] if len(value) > 1 else value[0]
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            return None
+        digest.update(repr((name, details, len(value))).encode('utf-8'))
+        digest.update(value)
+    return method.upper(), url, digest.hexdigest()
@@ -7,13 +7,22 @@
 
 import json
 import re
-import requests
+from concurrent.futures import ThreadPoolExecutor
+try:
+    # optional, decodes large lists several times faster
+    from orjson import loads as _loads
+except ImportError:
+    def _loads(content):
+        return json.loads(content.decode('utf-8'))
 try:
     from urllib import urlencode
 except ImportError:
     # Fallback to maintain backward compatibility with Python 2
     from urllib.parse import urlencode
 from craftar import settings
+from craftar._client import get_client
+from craftar._exceptions import _api_error
+from craftar._multipart import MultipartEncoder
 
 HEADERS = {
     'User-Agent': settings.USER_AGENT,
@@ -40,7 +49,7 @@ def _validate(object_type=None, data=None, uuid=None):
 
 
 def _validate_response(response):
-    "Validate the response from the API. Raise API, HTTP and url errors"
+    "Validate the response from the API. Raise an APIError on errors"
     try:
         # if there is an error message
         json_resp = response.json()
@@ -48,33 +57,54 @@ def _validate_response(response):
             msg = json_resp["error_message"]
         else:
             msg = json_resp["error"]
-        raise Exception("Error %s: %s" % (response.status_code, msg))
-    except (ValueError, KeyError):
+    except (ValueError, KeyError, TypeError):
         # if there is not error message, but there is an error
-        response.raise_for_status()
+        if response.status_code < 400:
+            return
+        msg = getattr(response, 'reason', None) or "HTTP error"
+    raise _api_error(response.status_code, msg, response)
+
+
+# fields holding the uri of a single object, or a list of uris
+_URI_KEYS = ("collection", "item", "version", "app", "tag")
+_URI_LIST_KEYS = ("collections", "tags")
 
 
 def _parse_object(_object):
     "Return a parsed object. Ugly API urls are replaced by UUIDs"
     # remove resource_uri
-    if "resource_uri" in _object:
-        del _object["resource_uri"]
+    _object.pop("resource_uri", None)
 
     # parse collection, item, app and version: set uuid instead of api uri
-    keys_to_parse = ["collection", "item", "version", "app", "tag"]
-    for key in keys_to_parse:
-        if key in _object:
-            _object[key] = _object[key].split("/")[-2]
+    for key in _URI_KEYS:
+        uri = _object.get(key)
+        if uri:
+            _object[key] = _uuid_from_uri(uri)
 
     # parse collections and tags
-    keys_to_parse = ["collections", "tags"]
-    for key in keys_to_parse:
-        if key in _object:
-            _object[key] = map(lambda uri: uri.split("/")[-2], _object[key])
+    for key in _URI_LIST_KEYS:
+        uris = _object.get(key)
+        if uris:
+            _object[key] = [_uuid_from_uri(uri) for uri in uris]
 
     return _object
 
 
+def _uuid_from_uri(uri):
+    "Return the uuid of an api uri: /api/<version>/<object_type>/<uuid>/"
+    # the same few collections and tags are referenced by a whole page
+    uuid = _uuids.get(uri)
+    if uuid is None:
+        if len(_uuids) >= 4096:
+            _uuids.clear()
+        # same as uri.split("/")[-2], without splitting the whole uri
+        uuid = _uuids[uri] = uri.rsplit("/", 2)[-2]
+    return uuid
+
+
+_uuids = {}  # uri -> uuid
+
+
 def _get_url(api_key, object_type, uuid=None, limit=None, offset=None,
              filter=None, filters_dict=None):
     "Return a valid API url, based on the parameters"
@@ -101,41 +131,116 @@ def _get_url(api_key, object_type, uuid=None, limit=None, offset=None,
     return url
 
 
+def _get_json(url, object_type, uuid=None):
+    """Get the decoded json at @url, through the cache of the client if it
+    has one. Expired responses are revalidated with their ETag"""
+    client = get_client()
+    cache = client.cache
+    if cache is None:
+        response = client.get(url)
+        _validate_response(response)
+        return _loads(response.content)
+
+    entry = cache.get(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.count(hit=True)
+        return _loads(entry.content)
+
+    headers = {}
+    if entry is not None and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    response = client.get(url, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        cache.refresh(url)
+        cache.count(revalidated=True)
+        return _loads(entry.content)
+
+    _validate_response(response)
+    cache.count()
+    cache.set(url, object_type, uuid, response.headers.get('ETag'),
+              response.content)
+    return _loads(response.content)
+
+
+def _invalidate(object_type=None, uuid=None):
+    "Remove the written object and the stale lists from the client cache"
+    cache = get_client().cache
+    if cache is not None:
+        cache.invalidate(object_type, uuid)
+
+
 def _get_object_list(api_key, object_type, limit=20, offset=0,
                      filter=None, filters_dict=None):
     "Get a list of objects"
+    return _get_object_page(api_key, object_type, limit, offset, filter,
+                            filters_dict)[1]
+
+
+def _get_object_page(api_key, object_type, limit=20, offset=0,
+                     filter=None, filters_dict=None):
+    """Get a page of objects, as a (meta, object_list) tuple.
+    The meta dictionary holds the pagination info of the response
+    (limit, offset, total_count, next and previous)"""
     _validate(object_type=object_type)
 
     url = _get_url(api_key, object_type, None, limit, offset, filter,
                    filters_dict)
-    response = requests.get(url)
-    _validate_response(response)
-
+    json_resp = _get_json(url, object_type)
     object_list = []
-    for unparsed_object in response.json()["objects"]:
+    for unparsed_object in json_resp["objects"]:
         parsed_object = _parse_object(unparsed_object)
         object_list.append(parsed_object)
-    return object_list
+    return json_resp.get("meta") or {}, object_list
+
+
+def _iter_object_list(api_key, object_type, page_size=None, filter=None,
+                      filters_dict=None):
+    """Iterate lazily over all the objects, one page at a time.
+    The next page is fetched in the background while the current one is
+    consumed, so at most two pages are held in memory."""
+    _validate(object_type=object_type)
+    if page_size is None:
+        page_size = settings.DEFAULT_PAGE_SIZE
+    assert page_size > 0, "Wrong page_size: %s" % page_size
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        offset = 0
+        future = executor.submit(_get_object_page, api_key, object_type,
+                                 page_size, offset, filter, filters_dict)
+        while future is not None:
+            meta, object_list = future.result()
+            offset += len(object_list)
+            if not object_list or not meta.get("next", True):
+                future = None
+            else:
+                future = executor.submit(_get_object_page, api_key,
+                                         object_type, page_size, offset,
+                                         filter, filters_dict)
+            for parsed_object in object_list:
+                yield parsed_object
+    finally:
+        # a page prefetched for an abandoned iteration is just discarded
+        executor.shutdown(wait=False)
 
 
 def _get_object(api_key, object_type, uuid):
     "Get a single object"
     _validate(object_type=object_type, uuid=uuid)
     url = _get_url(api_key, object_type, uuid)
-    response = requests.get(url)
-    _validate_response(response)
-    parsed_object = _parse_object(response.json())
+    parsed_object = _parse_object(_get_json(url, object_type, uuid))
     return parsed_object
 
 
 def _create_object(api_key, object_type, data):
     "Create a single object without an attachment"
     _validate(object_type=object_type, data=data)
-    response = requests.post(
+    response = get_client().post(
         url=_get_url(api_key, object_type),
         data=json.dumps(data),
         headers=HEADERS,
     )
+    _invalidate(object_type)
     _validate_response(response)
     parsed_object = _parse_object(response.json())
     if response.status_code == 201:
@@ -143,13 +248,16 @@ def _create_object(api_key, object_type, data):
 
 
 def _create_object_multipart(api_key, object_type, files, data):
-    "Create a single object with an attachment (image file)"
+    """Create a single object with an attachment (image file), streamed
+    from disk. @files maps field names to paths or (name, content) tuples"""
     _validate(object_type=object_type, data=data)
-    response = requests.post(
-        url=_get_url(api_key, object_type),
-        data=data,
-        files=files,
-    )
+    with MultipartEncoder(data, files) as body:
+        response = get_client().post(
+            url=_get_url(api_key, object_type),
+            data=body,
+            headers={'Content-Type': body.content_type},
+        )
+    _invalidate(object_type)
     _validate_response(response)
     parsed_object = _parse_object(response.json())
     if response.status_code == 201:
@@ -159,23 +267,27 @@ def _create_object_multipart(api_key, object_type, files, data):
 def _update_object(api_key, object_type, uuid, data):
     "Update a single object"
     _validate(object_type=object_type, data=data, uuid=uuid)
-    response = requests.put(
+    response = get_client().put(
         url=_get_url(api_key, object_type, uuid),
         data=json.dumps(data),
         headers=HEADERS,
     )
+    _invalidate(object_type, uuid)
     _validate_response(response)
     return (response.status_code == 202)
 
 
 def _update_object_multipart(api_key, object_type, uuid, files, data):
-    "Update a single object with an attachment (image file)"
+    """Update a single object with an attachment (image file), streamed
+    from disk as in _create_object_multipart"""
     _validate(object_type=object_type, data=data, uuid=uuid)
-    response = requests.put(
-        url=_get_url(api_key, object_type, uuid),
-        data=data,
-        files=files,
-    )
+    with MultipartEncoder(data, files) as body:
+        response = get_client().put(
+            url=_get_url(api_key, object_type, uuid),
+            data=body,
+            headers={'Content-Type': body.content_type},
+        )
+    _invalidate(object_type, uuid)
     _validate_response(response)
     return (response.status_code == 202)
 
@@ -183,8 +295,11 @@ def _update_object_multipart(api_key, object_type, uuid, files, data):
 def _delete_object(api_key, object_type, uuid):
     "Update a single object"
     _validate(object_type=object_type, uuid=uuid)
-    response = requests.delete(
+    response = get_client().delete(
         url=_get_url(api_key, object_type, uuid),
     )
+    _invalidate(object_type, uuid)
+    # deletions cascade, so the lists of other types may be stale too
+    _invalidate()
     _validate_response(response)
     return (response.status_code == 204)
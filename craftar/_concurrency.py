@@ -0,0 +1,44 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Provides internal helpers for running API calls concurrently"
+
+import collections
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def _bounded_submit(executor, fn, iterable, window, ordered=True):
+    """Submit fn(arg) for every arg in @iterable, keeping at most @window
+    calls pending, and yield (arg, future) pairs as the calls finish.
+
+    The iterable is consumed lazily, so memory stays bounded no matter how
+    many arguments it produces. Futures are yielded in submission order if
+    @ordered, otherwise in completion order. Pending calls are cancelled if
+    the generator is closed early.
+    """
+    window = max(1, window)
+    pending = collections.OrderedDict()
+    try:
+        for arg in iterable:
+            pending[executor.submit(fn, arg)] = arg
+            while len(pending) >= window:
+                for done in _pop_done(pending, ordered):
+                    yield done
+        while pending:
+            for done in _pop_done(pending, ordered):
+                yield done
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _pop_done(pending, ordered):
+    "Remove and return the finished (arg, future) pairs of @pending"
+    if ordered:
+        future, arg = pending.popitem(last=False)
+        wait([future])
+        return [(arg, future)]
+    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+    return [(pending.pop(future), future) for future in done]
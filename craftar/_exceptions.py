@@ -0,0 +1,85 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Provides the exceptions raised for the errors returned by CraftAR's API"
+
+import email.utils
+import time
+
+
+class CraftARError(Exception):
+    "Base class of the errors raised by the library"
+
+
+class APIError(CraftARError):
+    """The API answered with an error.
+
+    Attributes:
+      status_code - HTTP status of the response.
+      message     - Error message returned by the API.
+      response    - The response itself.
+    """
+
+    def __init__(self, status_code, message, response=None):
+        super(APIError, self).__init__("Error %s: %s" % (status_code,
+                                                         message))
+        self.status_code = status_code
+        self.message = message
+        self.response = response
+
+
+class ClientError(APIError):
+    "The request was rejected (4xx status), sending it again won't help"
+
+
+class NotFoundError(ClientError):
+    "The requested object doesn't exist (404 status)"
+
+
+class RateLimitError(ClientError):
+    """Too many requests were sent (429 status).
+
+    Attributes:
+      retry_after - Seconds to wait before retrying, as told by the API,
+                    or None.
+    """
+
+    def __init__(self, status_code, message, response=None):
+        super(RateLimitError, self).__init__(status_code, message, response)
+        self.retry_after = _retry_after(response)
+
+
+class ServerError(APIError):
+    "The API failed to process the request (5xx status)"
+
+
+def _api_error(status_code, message, response=None):
+    "Return the APIError matching @status_code"
+    if status_code == 404:
+        error_class = NotFoundError
+    elif status_code == 429:
+        error_class = RateLimitError
+    elif status_code >= 500:
+        error_class = ServerError
+    elif status_code >= 400:
+        error_class = ClientError
+    else:
+        error_class = APIError
+    return error_class(status_code, message, response)
+
+
+def _retry_after(response):
+    "Return the seconds to wait told by the Retry-After header, or None"
+    value = response is not None and response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # an HTTP date
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0.0, email.utils.mktime_tz(date) - time.time())
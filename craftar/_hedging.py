@@ -0,0 +1,153 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides hedged requests, cutting the tail latency of recognitions.
+
+A hedged call that hasn't answered within a delay (by default the 95th
+percentile of the latencies observed so far) is sent a second time, and the
+first answer is used. Only the slowest few calls are duplicated, so the
+extra load is small, and it is capped by a budget.
+"""
+
+import collections
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from craftar import _instrumentation
+
+
+class Hedger(object):
+    """Policy of the hedged requests, shared by all the threads calling it.
+
+    A duplicate that lost the race is not cancelled, it finishes in the
+    background and its latency is recorded.
+
+    Arguments:
+      delay       - Seconds to wait before sending the duplicate. None (the
+                    default) waits for the @percentile of the latencies
+                    observed, once @min_samples calls finished, and doesn't
+                    hedge before.
+      percentile  - Percentile of the observed latencies used as delay.
+      max_extra   - Maximum fraction of calls duplicated, e.g. 0.05 sends
+                    at most one extra request every 20 calls.
+      burst       - Number of duplicates that can be sent in a row after a
+                    while without sending any.
+      window      - Number of latest latencies the percentile is taken on.
+      min_samples - Latencies observed before hedging with an adaptive
+                    delay.
+
+    Attributes:
+      calls, hedged, wins - Number of calls, of duplicates sent, and of
+                            duplicates that answered first.
+    """
+
+    def __init__(self, delay=None, percentile=95, max_extra=0.05, burst=10,
+                 window=1000, min_samples=20):
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.burst = max(1, burst)
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedged = 0
+        self.wins = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._budget = float(self.burst)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        "Return the seconds to wait before hedging, or None not to hedge"
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        with self._lock:
+            if len(self._latencies) < max(1, self.min_samples):
+                return None
+            latencies = sorted(self._latencies)
+        return _instrumentation._percentile(latencies, self.percentile)
+
+    def call(self, function, *args, **kwargs):
+        """Return function(*args, **kwargs), calling it a second time if the
+        first call is slower than the delay and the budget allows it. An
+        error is raised only if every call sent failed."""
+        with self._lock:
+            self.calls += 1
+            self._budget = min(self.burst, self._budget + self.max_extra)
+        delay = self.delay()
+        if delay is None:
+            # not hedging yet, only observing the latencies
+            return self._run(function, args, kwargs)
+
+        start_time = _instrumentation._timer()
+        outcomes = queue.Queue()
+        self._start(outcomes, 0, function, args, kwargs)
+        hedged = False
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except queue.Empty:
+            hedged = self._spend()
+            if hedged:
+                self._start(outcomes, 1, function, args, kwargs)
+        else:
+            return _result(outcome)
+
+        pending = 2 if hedged else 1
+        while True:
+            outcome = outcomes.get()
+            pending -= 1
+            if outcome[1] is None or pending == 0:
+                break
+        if hedged:
+            won = outcome[1] is None and outcome[0] == 1
+            if won:
+                with self._lock:
+                    self.wins += 1
+            _instrumentation._emit(
+                "hedge", _instrumentation._timer() - start_time, won=won)
+        return _result(outcome)
+
+    def _spend(self):
+        "Take a duplicate from the budget, if any is left"
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.hedged += 1
+            return True
+
+    def _run(self, function, args, kwargs):
+        "Call @function, recording its latency if it succeeds"
+        start_time = _instrumentation._timer()
+        result = function(*args, **kwargs)
+        with self._lock:
+            self._latencies.append(_instrumentation._timer() - start_time)
+        return result
+
+    def _start(self, outcomes, attempt, function, args, kwargs):
+        "Call @function on a new thread, putting its outcome in @outcomes"
+
+        def run():
+            try:
+                result = self._run(function, args, kwargs)
+            except Exception as error:
+                outcomes.put((attempt, error, None))
+            else:
+                outcomes.put((attempt, None, result))
+
+        thread = threading.Thread(target=run)
+        # a duplicate that lost the race never holds the process
+        thread.daemon = True
+        thread.start()
+
+
+def _result(outcome):
+    "Return the result of an (attempt, error, result) outcome, or raise"
+    attempt, error, result = outcome
+    if error is not None:
+        raise error
+    return result
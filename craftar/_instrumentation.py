@@ -0,0 +1,153 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides hooks reporting the time spent in every phase of a request.
+
+A hook is a callable receiving an Event for every measured phase:
+ * prepare.open, prepare.decode, prepare.convert, prepare.resize and
+   prepare.encode, for the stages of preparing a query image. Images prepared
+   in other processes (search_many) are not reported.
+ * http, for every request sent by the client, with the method, the url
+   (without its query string), the status_code, the request_bytes and
+   response_bytes, and the seconds until the headers arrived (headers_time).
+ * search.parse, for decoding the response of a search, with the
+   search_time reported by the server, if any.
+
+Exporters for StatsD and Prometheus are provided as ready made hooks.
+When no hook is registered nothing is measured.
+"""
+
+import bisect
+import collections
+import math
+import socket
+import threading
+from timeit import default_timer as _timer
+
+Event = collections.namedtuple('Event', 'name duration info')
+
+_hooks = []
+
+
+def add_hook(hook):
+    "Call @hook with an Event for every measured phase"
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _emit(name, duration, **info):
+    for hook in list(_hooks):
+        hook(Event(name, duration, info))
+
+
+def _percentile(values, percent):
+    "Return the @percent percentile of the sorted @values, by nearest rank"
+    # percent * n / 100, not percent / 100 * n, which may round up past n
+    rank = int(math.ceil(percent * len(values) / 100.0)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class _Phases(object):
+    "Measures consecutive phases, reporting each one when it is done"
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.enabled = bool(_hooks)
+        self.last = self.enabled and _timer()
+
+    def done(self, phase, **info):
+        if self.enabled:
+            now = _timer()
+            _emit(self.prefix + phase, now - self.last, **info)
+            self.last = now
+
+
+class StatsdExporter(object):
+    """Hook sending the events to StatsD over UDP, as timings in
+    milliseconds, plus a counter per status code for the http events.
+
+    Arguments:
+      host, port - Address of the StatsD daemon.
+      prefix     - Prefix of the metric names.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='craftar'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, event):
+        lines = ["%s.%s:%.3f|ms" % (self.prefix, event.name,
+                                    1000 * event.duration)]
+        if 'status_code' in event.info:
+            lines.append("%s.%s.status.%s:1|c" % (
+                self.prefix, event.name, event.info['status_code']))
+        for key in ('request_bytes', 'response_bytes', 'size'):
+            if event.info.get(key) is not None:
+                lines.append("%s.%s.%s:%d|h" % (self.prefix, event.name, key,
+                                                event.info[key]))
+        try:
+            self.socket.sendto("\n".join(lines).encode('utf-8'),
+                               self.address)
+        except socket.error:
+            # metrics are best effort, never fail a request because of them
+            pass
+
+
+class PrometheusExporter(object):
+    """Hook aggregating the events in histograms, labelled by phase (and
+    status code for the http events). render() returns them in the
+    Prometheus text exposition format, to be served by the application.
+
+    Arguments:
+      buckets - Upper bounds of the histogram buckets, in seconds.
+      name    - Name of the histogram metric.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                       5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS,
+                 name='craftar_phase_duration_seconds'):
+        self.buckets = tuple(sorted(buckets))
+        self.name = name
+        self._histograms = {}  # labels -> [bucket counts, count, sum]
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        labels = (('phase', event.name),)
+        if 'status_code' in event.info:
+            labels += (('status', str(event.info['status_code'])),)
+        index = bisect.bisect_left(self.buckets, event.duration)
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = [[0] * len(self.buckets), 0, 0.0]
+                self._histograms[labels] = histogram
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += 1
+            histogram[2] += event.duration
+
+    def render(self):
+        lines = ["# TYPE %s histogram" % self.name]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            for labels, (counts, count, total) in histograms:
+                label_text = ",".join('%s="%s"' % label for label in labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        self.name, label_text, bound, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+                    self.name, label_text, count))
+                lines.append('%s_count{%s} %d' % (self.name, label_text,
+                                                  count))
+                lines.append('%s_sum{%s} %f' % (self.name, label_text, total))
+        return "\n".join(lines) + "\n"
@@ -7,9 +7,13 @@
 
 from craftar._common import _get_object_list, _get_object, _create_object, \
     _create_object_multipart, _update_object, _update_object_multipart,  \
-    _delete_object
+    _delete_object, _iter_object_list, _get_object_page
+from craftar._concurrency import _bounded_submit
 from craftar import settings
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 
 
 def _get_object_uri(object_type, uuid):
@@ -26,6 +30,14 @@ def get_collection_list(api_key, limit, offset, filters=None):
                             filters_dict=filters)
 
 
+def iter_collections(api_key, filters=None, page_size=None):
+    """Iterate over all the collections, fetching @page_size at a time.
+    Filter by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "collection", page_size,
+                             filters_dict=filters)
+
+
 def get_collection(api_key, uuid):
     "Return a collection, identified by @uuid"
     return _get_object(api_key, "collection", uuid)
@@ -59,6 +71,14 @@ def get_item_list(api_key, limit, offset, collection=None, filters=None):
                             filters_dict=filters)
 
 
+def iter_items(api_key, collection=None, filters=None, page_size=None):
+    """Iterate over all the items, fetching @page_size at a time.
+    Filter by @collection or by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "item", page_size, filter=collection,
+                             filters_dict=filters)
+
+
 def get_item(api_key, uuid):
     "Return an item, identified by @uuid"
     return _get_object(api_key, "item", uuid)
@@ -81,7 +101,7 @@ def create_item(api_key, collection, name, url=None, custom=None,
     if content is not None:
         data['content'] = content
     if tags is not None:
-        data['tags'] = map(lambda uuid: _get_object_uri('tag', uuid), tags)
+        data['tags'] = [_get_object_uri('tag', uuid) for uuid in tags]
 
     return _create_object(api_key, "item", data)
 
@@ -101,7 +121,7 @@ def update_item(api_key, uuid, name=None, url=None, custom=None,
     if content is not None:
         data['content'] = content
     if tags is not None:
-        data['tags'] = map(lambda uuid: _get_object_uri('tag', uuid), tags)
+        data['tags'] = [_get_object_uri('tag', uuid) for uuid in tags]
 
     return _update_object(api_key, "item", uuid, data)
 
@@ -120,22 +140,62 @@ def get_image_list(api_key, limit, offset, item=None, filters=None):
                             filters_dict=filters)
 
 
+def iter_images(api_key, item=None, filters=None, page_size=None):
+    """Iterate over all the images, fetching @page_size at a time.
+    Filter by @item or by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "image", page_size, filter=item,
+                             filters_dict=filters)
+
+
 def get_image(api_key, uuid):
     "Return an image, identified by @uuid"
     return _get_object(api_key, "image", uuid)
 
 
-def create_image(api_key, item, filename):
-    "Create an image from a @filename, belongs to @item"
-    files = {'file': open(filename, 'rb')}
+def create_image(api_key, item, filename, normalize=False):
+    """Create an image from a @filename, belongs to @item.
+    With @normalize, the image is downscaled to
+    settings.DEFAULT_REFERENCE_MAX_SIZE, stripped of its EXIF metadata
+    and recompressed before uploading it."""
+    if normalize:
+        # imported here, so that Pillow is only loaded if needed
+        from craftar._recognition import _normalize_image
+        content, _ = _normalize_image(filename)
+        return _create_image_content(
+            api_key, item, _normalized_name(filename, content), content)
+    files = {'file': filename}
+    data = {'item': _get_object_uri('item', item)}
+
+    return _create_object_multipart(api_key, "image", files, data)
+
+
+def _create_image_content(api_key, item, name, content):
+    "Create an image named @name from its @content, belongs to @item"
+    files = {'file': (name, content)}
     data = {'item': _get_object_uri('item', item)}
 
     return _create_object_multipart(api_key, "image", files, data)
 
 
-def update_image(api_key, uuid, filename):
-    "Update the image file, identified by @uuid"
-    files = {'file': open(filename, 'rb')}
+def _normalized_name(filename, content):
+    "Return the name of the normalized @content of @filename"
+    name = os.path.basename(filename)
+    if bytes(content[:2]) == b'\xff\xd8':
+        # recompressed as jpeg, unless the original was smaller
+        name = os.path.splitext(name)[0] + ".jpg"
+    return name
+
+
+def update_image(api_key, uuid, filename, normalize=False):
+    """Update the image file, identified by @uuid.
+    With @normalize, the image is prepared as in create_image."""
+    if normalize:
+        from craftar._recognition import _normalize_image
+        content, _ = _normalize_image(filename)
+        files = {'file': (_normalized_name(filename, content), content)}
+    else:
+        files = {'file': filename}
     return _update_object_multipart(api_key, "image", uuid, files, None)
 
 
@@ -153,12 +213,20 @@ def get_token_list(api_key, limit, offset, collection=None, filters=None):
                             filter=collection, filters_dict=filters)
 
 
+def iter_tokens(api_key, collection=None, filters=None, page_size=None):
+    """Iterate over all the tokens, fetching @page_size at a time.
+    Filter by @collection or by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "token", page_size, filter=collection,
+                             filters_dict=filters)
+
+
 def create_token(api_key, collection, tags=None):
     "Create a token, belongs to @collection"
     data = {'collection': _get_object_uri('collection', collection)}
 
     if tags is not None:
-        data['tags'] = map(lambda uuid: _get_object_uri('tag', uuid), tags)
+        data['tags'] = [_get_object_uri('tag', uuid) for uuid in tags]
 
     return _create_object(api_key, "token", data)
 
@@ -168,7 +236,7 @@ def update_token(api_key, uuid, tags=None):
     data = {}
 
     if tags is not None:
-        data['tags'] = map(lambda uuid: _get_object_uri('tag', uuid), tags)
+        data['tags'] = [_get_object_uri('tag', uuid) for uuid in tags]
 
     return _update_object(api_key, "token", uuid, data)
 
@@ -187,6 +255,14 @@ def get_media_list(api_key, limit, offset, filters=None):
                             filters_dict=filters)
 
 
+def iter_media(api_key, filters=None, page_size=None):
+    """Iterate over all the media objects, fetching @page_size at a time.
+    Filter by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "media", page_size,
+                             filters_dict=filters)
+
+
 def get_media(api_key, uuid):
     "Return a media object, identified by @uuid"
     return _get_object(api_key, "media", uuid)
@@ -194,7 +270,7 @@ def get_media(api_key, uuid):
 
 def create_media(api_key, filename):
     "Create a media object from a @filename, belongs to @item"
-    files = {'file': open(filename, 'rb')}
+    files = {'file': filename}
 
     return _create_object_multipart(api_key, "media", files, {})
 
@@ -223,6 +299,14 @@ def get_tag_list(api_key, limit, offset, collection=None, filters=None):
                             filters_dict=filters)
 
 
+def iter_tags(api_key, collection=None, filters=None, page_size=None):
+    """Iterate over all the tags, fetching @page_size at a time.
+    Filter by @collection or by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "tag", page_size, filter=collection,
+                             filters_dict=filters)
+
+
 def get_tag(api_key, uuid):
     "Return an item, identified by @uuid"
     return _get_object(api_key, "tag", uuid)
@@ -252,6 +336,13 @@ def get_app_list(api_key, limit, offset, filters=None):
                             filters_dict=filters)
 
 
+def iter_apps(api_key, filters=None, page_size=None):
+    """Iterate over all the applications, fetching @page_size at a time.
+    Filter by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "app", page_size, filters_dict=filters)
+
+
 def get_app(api_key, uuid):
     "Return an application, identified by @uuid"
     return _get_object(api_key, "app", uuid)
@@ -276,6 +367,14 @@ def get_version_list(api_key, limit, offset, filters=None):
                             filters_dict=filters)
 
 
+def iter_versions(api_key, filters=None, page_size=None):
+    """Iterate over all the SDK versions, fetching @page_size at a time.
+    Filter by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "version", page_size,
+                             filters_dict=filters)
+
+
 def get_version(api_key, uuid):
     "Return an SDK Version, identified by @uuid"
     return _get_object(api_key, "version", uuid)
@@ -290,6 +389,14 @@ def get_bundle_list(api_key, limit, offset, filters=None):
                             filters_dict=filters)
 
 
+def iter_bundles(api_key, filters=None, page_size=None):
+    """Iterate over all the bundles, fetching @page_size at a time.
+    Filter by providing a dictionary with filter name
+    and value with @filters as described in the API documentation."""
+    return _iter_object_list(api_key, "collectionbundle", page_size,
+                             filters_dict=filters)
+
+
 def get_bundle(api_key, uuid):
     "Return a bundle, identified by @uuid"
     return _get_object(api_key, "collectionbundle", uuid)
@@ -314,3 +421,134 @@ def create_bundle(api_key, collection, app, version, tag=None):
 def delete_bundle(api_key, uuid):
     "Delete a bundle, identified by @uuid"
     return _delete_object(api_key, "collectionbundle", uuid)
+
+
+# Full listings
+def list_all(api_key, object_type, filter=None, filters=None, page_size=None,
+             concurrency=8):
+    """Return the list of all the objects of @object_type.
+    The first page tells the total count of objects, then the remaining
+    pages are fetched with up to @concurrency requests in flight and
+    merged in order. Filter by @filter (the collection of items, tokens and
+    tags or the item of images) or by providing a dictionary with filter
+    name and value with @filters as described in the API documentation.
+
+    Objects created or deleted while listing may shift the pages, use
+    iter_* for a sequential walk. Set settings.POOL_MAXSIZE to at least
+    @concurrency, so that every request reuses a pooled connection."""
+    if page_size is None:
+        page_size = settings.DEFAULT_PAGE_SIZE
+    meta, object_list = _get_object_page(api_key, object_type, page_size, 0,
+                                         filter, filters)
+    total_count = meta.get("total_count", len(object_list))
+    # the server may return smaller pages than requested
+    page_size = len(object_list) or page_size
+    offsets = range(len(object_list), total_count, page_size)
+    if not offsets:
+        return object_list
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        pages = executor.map(
+            lambda offset: _get_object_list(api_key, object_type, page_size,
+                                            offset, filter, filters),
+            offsets)
+        for page in pages:
+            object_list.extend(page)
+    finally:
+        executor.shutdown(wait=False)
+    return object_list
+
+
+# Bulk operations
+BulkResult = namedtuple('BulkResult', 'key result error')
+
+
+class BulkReport(object):
+    """Outcome of a bulk operation, one BulkResult (key, result, error) per
+    object: the key identifies the object (its uuid, or its index in the
+    input for creations), and either result or error is set."""
+
+    def __init__(self):
+        self.results = []
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.error is None]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if r.error is not None]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+
+def bulk_create_items(api_key, collection, items, concurrency=8,
+                      progress=None):
+    """Create an item in @collection for every dictionary of create_item
+    arguments (name, url, custom, trackable, content, tags) in @items.
+    Return a BulkReport keyed by the index of every item in @items."""
+    def create(args):
+        index, fields = args
+        return index, create_item(api_key, collection, **fields)
+    return _bulk(create, enumerate(items), concurrency, progress)
+
+
+def bulk_update_items(api_key, updates, concurrency=8, progress=None):
+    """Update an item for every dictionary of update_item arguments in
+    @updates, each one with the "uuid" of the item to update.
+    Return a BulkReport keyed by uuid."""
+    def update(fields):
+        fields = dict(fields)
+        uuid = fields.pop("uuid")
+        return uuid, update_item(api_key, uuid, **fields)
+    return _bulk(update, updates, concurrency, progress,
+                 key=lambda fields: fields.get("uuid"))
+
+
+def bulk_create_images(api_key, images, normalize=False, concurrency=8,
+                       progress=None):
+    """Create an image for every (item, filename) pair in @images, as
+    create_image does. Return a BulkReport keyed by filename."""
+    def create(args):
+        item, filename = args
+        return filename, create_image(api_key, item, filename, normalize)
+    return _bulk(create, images, concurrency, progress,
+                 key=lambda args: args[1])
+
+
+def bulk_delete(api_key, object_type, uuids, concurrency=8, progress=None):
+    """Delete every object of @object_type identified in @uuids.
+    Return a BulkReport keyed by uuid."""
+    def delete(uuid):
+        return uuid, _delete_object(api_key, object_type, uuid)
+    return _bulk(delete, uuids, concurrency, progress, key=lambda uuid: uuid)
+
+
+def _bulk(func, args_iterable, concurrency, progress,
+          key=lambda args: args[0]):
+    """Call @func for every argument of @args_iterable, with up to
+    @concurrency requests in flight. @func returns a (key, result) tuple,
+    failures are reported with the @key of their argument. @progress, if
+    given, is called with every BulkResult as soon as it is known.
+    Set settings.POOL_MAXSIZE to at least @concurrency, so that every
+    request reuses a pooled connection."""
+    report = BulkReport()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        for args, future in _bounded_submit(executor, func, args_iterable,
+                                            2 * concurrency, ordered=False):
+            try:
+                result = BulkResult(*future.result(), error=None)
+            except Exception as e:
+                result = BulkResult(key(args), None, e)
+            report.results.append(result)
+            if progress is not None:
+                progress(result)
+    finally:
+        executor.shutdown(wait=True)
+    return report
@@ -0,0 +1,205 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides a local SQLite copy of a collection, refreshed incrementally.
+
+Questions such as which items have no images, or the uuid of an item by
+name, are answered with local queries instead of listing the whole
+collection through the API every time.
+"""
+
+import json
+import sqlite3
+
+from craftar._common import _iter_object_list
+
+# object type -> filter restricting its list to a collection
+_COLLECTION_FILTERS = {
+    "item": "collection__uuid",
+    "image": "item__collection__uuid",
+    "tag": "collection__uuid",
+    "token": "collection__uuid",
+}
+
+
+class CollectionMirror(object):
+    """Local copy of the items, images, tags and tokens of a collection.
+
+    The first refresh lists every object. The following ones only list the
+    objects modified since the previous one, by filtering on @modified_field.
+    Objects deleted through the API are only noticed by a full refresh.
+
+    Arguments:
+      api_key        - Your API key.
+      collection     - uuid of the mirrored collection.
+      path           - Path to the SQLite database, created if missing.
+                       Defaults to an in-memory database.
+      modified_field - Modification date field of the objects, filtered as
+                       <modified_field>__gte=<latest date seen>.
+      page_size      - Objects per request when listing.
+    """
+
+    def __init__(self, api_key, collection, path=":memory:",
+                 modified_field="modification_date", page_size=None):
+        self.api_key = api_key
+        self.collection = collection
+        self.path = path
+        self.modified_field = modified_field
+        self.page_size = page_size
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS items (
+                uuid TEXT PRIMARY KEY, collection TEXT, name TEXT,
+                modified TEXT, data TEXT NOT NULL, seen INTEGER);
+            CREATE INDEX IF NOT EXISTS items_name ON items (name);
+            CREATE INDEX IF NOT EXISTS items_collection
+                ON items (collection);
+            CREATE TABLE IF NOT EXISTS images (
+                uuid TEXT PRIMARY KEY, item TEXT, name TEXT,
+                modified TEXT, data TEXT NOT NULL, seen INTEGER);
+            CREATE INDEX IF NOT EXISTS images_item ON images (item);
+            CREATE INDEX IF NOT EXISTS images_name ON images (name);
+            CREATE TABLE IF NOT EXISTS tags (
+                uuid TEXT PRIMARY KEY, collection TEXT, name TEXT,
+                modified TEXT, data TEXT NOT NULL, seen INTEGER);
+            CREATE INDEX IF NOT EXISTS tags_name ON tags (name);
+            CREATE TABLE IF NOT EXISTS tokens (
+                uuid TEXT PRIMARY KEY, collection TEXT, name TEXT,
+                modified TEXT, data TEXT NOT NULL, seen INTEGER);
+            CREATE TABLE IF NOT EXISTS item_tags (
+                item TEXT NOT NULL, tag TEXT NOT NULL,
+                PRIMARY KEY (item, tag));
+            CREATE INDEX IF NOT EXISTS item_tags_tag ON item_tags (tag);
+            CREATE TABLE IF NOT EXISTS sync (
+                object_type TEXT PRIMARY KEY, collection TEXT NOT NULL,
+                modified TEXT);
+        """)
+
+    def refresh(self, full=False):
+        """Bring the mirror up to date. A @full refresh lists everything
+        again, dropping the objects deleted since the last one.
+        Return the number of objects fetched."""
+        fetched = 0
+        for object_type in ("item", "image", "tag", "token"):
+            fetched += self._refresh(object_type, full)
+        return fetched
+
+    def _refresh(self, object_type, full):
+        table = object_type + "s"
+        state = self.connection.execute(
+            "SELECT collection, modified FROM sync WHERE object_type = ?",
+            (object_type,)).fetchone()
+        if state is None or state["collection"] != self.collection:
+            # never refreshed, or mirroring another collection
+            full = True
+        filters = {_COLLECTION_FILTERS[object_type]: self.collection}
+        latest = state and state["modified"]
+        if not full and latest:
+            filters["%s__gte" % self.modified_field] = latest
+
+        fetched = 0
+        with self.connection:
+            if full:
+                self.connection.execute("UPDATE %s SET seen = 0" % table)
+            for parsed_object in _iter_object_list(
+                    self.api_key, object_type, self.page_size, None,
+                    filters):
+                modified = parsed_object.get(self.modified_field)
+                self._store(object_type, parsed_object, modified)
+                if modified is not None and (latest is None or
+                                             str(modified) > latest):
+                    latest = str(modified)
+                fetched += 1
+            if full:
+                self.connection.execute("DELETE FROM %s WHERE seen = 0" %
+                                        table)
+                self.connection.execute(
+                    "DELETE FROM item_tags WHERE item NOT IN "
+                    "(SELECT uuid FROM items)")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync VALUES (?, ?, ?)",
+                (object_type, self.collection, latest))
+        return fetched
+
+    def _store(self, object_type, parsed_object, modified):
+        uuid = parsed_object.get("uuid") or parsed_object.get("token")
+        parent = parsed_object.get("item" if object_type == "image"
+                                   else "collection")
+        self.connection.execute(
+            "INSERT OR REPLACE INTO %ss VALUES (?, ?, ?, ?, ?, 1)" %
+            object_type,
+            (uuid, parent, parsed_object.get("name"),
+             None if modified is None else str(modified),
+             json.dumps(parsed_object)))
+        if object_type == "item":
+            self.connection.execute("DELETE FROM item_tags WHERE item = ?",
+                                    (uuid,))
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO item_tags VALUES (?, ?)",
+                [(uuid, tag) for tag in parsed_object.get("tags") or []])
+
+    def get(self, object_type, uuid):
+        "Return the object of @object_type identified by @uuid, or None"
+        row = self.connection.execute(
+            "SELECT data FROM %ss WHERE uuid = ?" % _table(object_type),
+            (uuid,)).fetchone()
+        return row and json.loads(row["data"])
+
+    def find(self, object_type, name=None, parent=None):
+        """Return the objects of @object_type named @name and belonging to
+        @parent (the item of images, the collection of the others)"""
+        query = "SELECT data FROM %ss WHERE 1" % _table(object_type)
+        args = []
+        if name is not None:
+            query += " AND name = ?"
+            args.append(name)
+        if parent is not None:
+            query += " AND %s = ?" % ("item" if object_type == "image"
+                                      else "collection")
+            args.append(parent)
+        return [json.loads(row["data"])
+                for row in self.connection.execute(query, args)]
+
+    def item_uuids_by_name(self):
+        "Return a dictionary mapping every item name to its uuid"
+        return dict(self.connection.execute("SELECT name, uuid FROM items"))
+
+    def items_without_images(self):
+        "Return the items with no image"
+        return [json.loads(row["data"]) for row in self.connection.execute(
+            "SELECT data FROM items WHERE NOT EXISTS "
+            "(SELECT 1 FROM images WHERE images.item = items.uuid)")]
+
+    def items_with_tag(self, tag):
+        "Return the items tagged with the tag @tag (a uuid)"
+        return [json.loads(row["data"]) for row in self.connection.execute(
+            "SELECT data FROM items JOIN item_tags "
+            "ON item_tags.item = items.uuid WHERE item_tags.tag = ?",
+            (tag,))]
+
+    def execute(self, query, *args):
+        """Run a SQL @query on the mirror, for anything else. The tables
+        items, images, tags and tokens hold the uuid, name, parent
+        (collection or item), modified date and JSON data of every object,
+        and item_tags relates items and tags."""
+        return self.connection.execute(query, args).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _table(object_type):
+    assert object_type in _COLLECTION_FILTERS, \
+        "Wrong object_type: %s" % object_type
+    return object_type
@@ -0,0 +1,152 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides a streaming encoder of multipart/form-data request bodies.
+
+The body is read by the HTTP client in chunks, so uploading a file costs a
+chunk of memory instead of the whole file, whatever its size. Its length is
+known up front, so the request is sent with a Content-Length header rather
+than chunked.
+"""
+
+import mimetypes
+import os
+import uuid as uuid_module
+
+
+class MultipartEncoder(object):
+    """File-like multipart/form-data body, to be sent as the data of a
+    request with its content_type as the Content-Type header.
+
+    Files are opened only while they are being read and closed as soon as
+    they are read, or when the encoder is closed, which happens on leaving
+    a with block.
+
+    Arguments:
+      fields - Dictionary of form fields, None values are skipped.
+      files  - Dictionary of file fields. Every value is either the path to
+               the file, or a (filename, content) tuple with the content
+               held in memory.
+    """
+
+    def __init__(self, fields=None, files=None):
+        self.boundary = uuid_module.uuid4().hex
+        self.content_type = "multipart/form-data; boundary=%s" % \
+            self.boundary
+        self._segments = []  # (offset, length, content or path, is_path)
+        self._length = 0
+        self._position = 0
+        self._file = None  # (path, open file) being read
+
+        for name, value in sorted((fields or {}).items()):
+            if value is None:
+                continue
+            if not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            self._add(self._part_header(name))
+            self._add(value)
+            self._add(b"\r\n")
+        for name, value in sorted((files or {}).items()):
+            if isinstance(value, tuple):
+                filename, content = value
+                self._add(self._part_header(name, filename))
+                self._add(content)
+            else:
+                self._add(self._part_header(name, os.path.basename(value)))
+                self._add_file(value)
+            self._add(b"\r\n")
+        self._add(("--%s--\r\n" % self.boundary).encode('utf-8'))
+
+    def _part_header(self, name, filename=None):
+        header = '--%s\r\nContent-Disposition: form-data; name="%s"' % (
+            self.boundary, _quote(name))
+        if filename is not None:
+            content_type = mimetypes.guess_type(filename)[0] or \
+                'application/octet-stream'
+            header += '; filename="%s"\r\nContent-Type: %s' % (
+                _quote(filename), content_type)
+        return (header + "\r\n\r\n").encode('utf-8')
+
+    def _add(self, content):
+        self._segments.append((self._length, len(content), content, False))
+        self._length += len(content)
+
+    def _add_file(self, path):
+        size = os.path.getsize(path)
+        self._segments.append((self._length, size, path, True))
+        self._length += size
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._position = max(0, min(offset, self._length))
+        return self._position
+
+    def read(self, size=-1):
+        "Read up to @size bytes of the body, all of it if negative"
+        if size is None or size < 0:
+            size = self._length - self._position
+        chunks = []
+        while size > 0 and self._position < self._length:
+            chunk = self._read_segment(size)
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _read_segment(self, size):
+        "Read up to @size bytes of the segment at the current position"
+        for offset, length, content, is_path in self._segments:
+            if offset <= self._position < offset + length:
+                break
+        start = self._position - offset
+        size = min(size, length - start)
+        if not is_path:
+            chunk = content[start:start + size]
+            if isinstance(chunk, memoryview):
+                return chunk.tobytes()
+            return bytes(chunk)
+
+        if self._file is None or self._file[0] != content:
+            self._close_file()
+            self._file = (content, open(content, 'rb'))
+        file_object = self._file[1]
+        if file_object.tell() != start:
+            file_object.seek(start)
+        chunk = file_object.read(size)
+        if len(chunk) < size:
+            raise IOError("File changed while uploading it: %s" % content)
+        if start + size == length:
+            self._close_file()
+        return chunk
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file[1].close()
+            self._file = None
+
+    def close(self):
+        "Close the file being read, if any"
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _quote(value):
+    "Escape a name or filename for a Content-Disposition header"
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\r', ' ').replace('\n', ' ')
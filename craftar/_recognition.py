@@ -10,21 +10,37 @@ if needed, transformed (i.e. resized, converted to grayscale, and compressed
 as jpeg).
 """
 
-from PIL import Image
+from PIL import Image, ImageOps
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
+from timeit import default_timer as _timer
 from craftar import settings
-import requests
+from craftar._cache import _image_hash, _search_key
+from craftar._client import get_client
+from craftar._common import _validate_response
+from craftar._concurrency import _bounded_submit
+from craftar._instrumentation import _Phases
+
+# high quality filter for the final resize (ANTIALIAS before Pillow 2.7)
+_RESAMPLE = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+
+SearchResult = namedtuple('SearchResult',
+                          'filename response elapsed payload_size error')
 
 
 def search(token, filename, embed_custom=False, embed_tracking=False,
            bbox=False, app_id=None, strategy="closeup", version=None,
            color=False, min_size=settings.DEFAULT_QUERY_MIN_SIZE,
-           verbose=False):
+           verbose=False, cache=None, prepared_cache=None, hedger=None,
+           timeout=None):
     """Performs a visual recognition using CraftAR's API.
 
     Arguments:
       token          - Token for the target collection.
-      filename       - Path to the query image file.
+      filename       - Path to the query image file, or the query image
+                       as bytes, memoryview, binary file object, PIL image
+                       or numpy array (see _prepare_image).
       embed_custom   - custom_data will be embedded.
       embed_tracking - tracking_data will be embedded.
       bbox           - Return bounding boxes.
@@ -38,10 +54,135 @@ def search(token, filename, embed_custom=False, embed_tracking=False,
                        may require higher values.
                        Rescaling can be disabled by using using min_size = -1.
       verbose        - Shows all image transformations performed to the query.
+      cache          - SearchCache answering queries similar to previous
+                       ones without a request.
+      prepared_cache - PreparedCache holding the query images already
+                       prepared, so that files queried again are not
+                       prepared again.
+      hedger         - Hedger sending the prepared query a second time if
+                       the first request is too slow, and returning the
+                       first answer.
+      timeout        - Seconds to wait for the server, or a (connect, read)
+                       tuple. Defaults to the timeouts of the client.
+    """
+    image = _prepare_cached(prepared_cache, filename, color, min_size,
+                            verbose)
+
+    options = (embed_custom, embed_tracking, bbox, app_id, strategy, version)
+    return _search_cached(cache, token, image, options, color, min_size,
+                          hedger, timeout)
+
+
+def search_many(token, filenames, concurrency=4, processes=None,
+                ordered=False, embed_custom=False, embed_tracking=False,
+                bbox=False, app_id=None, strategy="closeup", version=None,
+                color=False, min_size=settings.DEFAULT_QUERY_MIN_SIZE,
+                verbose=False, cache=None, prepared_cache=None, hedger=None,
+                timeout=None):
+    """Performs many visual recognitions concurrently using CraftAR's API.
+
+    Query images are prepared on a pool of processes and sent on a pool of
+    threads sharing the pooled client. Return a generator of SearchResult
+    tuples (filename, response, elapsed, payload_size, error), where elapsed
+    is the round-trip time of the request in seconds and payload_size the
+    number of bytes of the prepared query. A query that fails (e.g. an
+    unreadable image or a connection error) doesn't stop the others: its
+    result has the exception raised as error, and None as response (and as
+    elapsed and payload_size if it failed before being sent).
+
+    Arguments:
+      token       - Token for the target collection.
+      filenames   - Iterable of paths to query image files, or of any other
+                    query accepted by search(). It is consumed lazily, so
+                    a generator can be used for large sets. File objects
+                    can't be sent to other processes, use processes=0.
+      concurrency - Maximum number of requests in flight.
+      processes   - Number of processes preparing the query images. None
+                    uses one per CPU, 0 prepares them in the sending threads.
+      ordered     - Yield the results in the order of @filenames instead
+                    of the order in which they finish.
+
+    The remaining arguments are the same as in search().
     """
-    image = _prepare_image(filename, color, min_size, verbose)
+    options = (embed_custom, embed_tracking, bbox, app_id, strategy, version)
+    process_pool = None
+    if processes != 0:
+        process_pool = ProcessPoolExecutor(max_workers=processes)
+    thread_pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def query(task):
+        filename, prepared = task
+        try:
+            if prepared is None:
+                image = _prepare_cached(prepared_cache, filename, color,
+                                        min_size, verbose)
+            else:
+                image, hits, misses = prepared.result()
+                if prepared_cache is not None:
+                    prepared_cache._count(hits, misses)
+        except Exception as error:
+            return SearchResult(filename, None, None, None, error)
+        start_time = _timer()
+        try:
+            response = _search_cached(cache, token, image, options, color,
+                                      min_size, hedger, timeout)
+        except Exception as error:
+            return SearchResult(filename, None, _timer() - start_time,
+                                _payload_size(image), error)
+        return SearchResult(filename, response, _timer() - start_time,
+                            _payload_size(image), None)
+
+    def tasks():
+        for filename in filenames:
+            prepared = None
+            if process_pool is not None:
+                # submitted from the calling thread, so the worker processes
+                # are never forked from one of the sending threads
+                prepared = process_pool.submit(_prepare_in_worker,
+                                               prepared_cache, filename,
+                                               color, min_size, verbose)
+            yield filename, prepared
+
+    try:
+        for _, future in _bounded_submit(thread_pool, query, tasks(),
+                                         2 * concurrency, ordered):
+            yield future.result()
+    finally:
+        thread_pool.shutdown(wait=True)
+        if process_pool is not None:
+            process_pool.shutdown(wait=True)
 
-    response = requests.post(
+
+def _search_cached(cache, token, image, options, color, min_size,
+                   hedger=None, timeout=None):
+    "Send a prepared query @image, answering it from @cache if possible"
+    if cache is None:
+        return _search_hedged(hedger, token, image, options, timeout)
+
+    key = _search_key(token, color, min_size, *options)
+    image_hash = _image_hash(image)
+    response = cache.get(key, image_hash)
+    if response is None:
+        response = _search_hedged(hedger, token, image, options, timeout)
+        cache.set(key, image_hash, response)
+    return response
+
+
+def _search_hedged(hedger, token, image, options, timeout=None):
+    "Send a prepared query @image, through @hedger if any"
+    if hedger is None:
+        return _search_prepared(token, image, *options, timeout=timeout)
+    # the duplicate request sends the same prepared payload, and must not
+    # share the response of the request it is hedging
+    return hedger.call(_search_prepared, token, image, *options,
+                       timeout=timeout, coalesce=False)
+
+
+def _search_prepared(token, image, embed_custom=False, embed_tracking=False,
+                     bbox=False, app_id=None, strategy="closeup",
+                     version=None, timeout=None, coalesce=True):
+    "Send an already prepared query @image to the recognition API"
+    response = get_client().post(
         url="%s/%s/search" % (settings.RECOGNITION_HOSTNAME,
                               settings.RECOGNITION_API_VERSION),
         headers={'User-Agent': settings.USER_AGENT},
@@ -55,13 +196,24 @@ def search(token, filename, embed_custom=False, embed_tracking=False,
             'version': version,
         },
         files={'image': image},
+        idempotent=True,
+        coalesce=coalesce,
+        timeout=timeout,
     )
 
-    return response.json()
+    phases = _Phases("search.")
+    result = _json(response)
+    phases.done("parse", search_time=result.get('search_time'))
+    return result
 
 
 def sync(token, app_id, version, bundled=True, tag=None):
-    response = requests.post(
+    return _json(_sync_request(token, app_id, version, bundled, tag))
+
+
+def _sync_request(token, app_id, version, bundled=True, tag=None):
+    "Send a sync request, return the response without decoding it"
+    return get_client().post(
         url="%s/%s/sync" % (settings.RECOGNITION_HOSTNAME,
                             settings.RECOGNITION_API_VERSION),
         headers={'User-Agent': settings.USER_AGENT},
@@ -72,35 +224,81 @@ def sync(token, app_id, version, bundled=True, tag=None):
             'bundled': bundled and 'true' or 'false',
             'tag': tag,
         },
+        idempotent=True,
     )
 
-    return response.json()
+
+def _json(response):
+    "Return the decoded response, errors included if the API explains them"
+    try:
+        return response.json()
+    except ValueError:
+        _validate_response(response)
+        raise
+
+
+def _prepare_cached(prepared_cache, image_file, color=False,
+                    min_size=settings.DEFAULT_QUERY_MIN_SIZE, verbose=True):
+    "Prepare @image_file as _prepare_image does, through @prepared_cache"
+    if prepared_cache is None or not _is_path(image_file) or \
+            (color and min_size <= 0):
+        # no cache, a query in memory or a query sent as it is
+        return _prepare_image(image_file, color, min_size, verbose)
+
+    key = prepared_cache.key(image_file, color, min_size,
+                             settings.DEFAULT_IMG_QUALITY,
+                             settings.QUERY_DRAFT_DECODE)
+    image = prepared_cache.get(key)
+    if image is None:
+        image = _prepare_image(image_file, color, min_size, verbose)
+        prepared_cache.set(key, image)
+    elif verbose:
+        print("Sending Cached Query")
+    return image
+
+
+def _prepare_in_worker(prepared_cache, image_file, color, min_size, verbose):
+    """Prepare @image_file in a worker process of search_many. Return the
+    prepared query and the hits and misses of @prepared_cache meanwhile,
+    added to the counters of the calling process"""
+    if prepared_cache is None:
+        return _prepare_image(image_file, color, min_size, verbose), 0, 0
+    hits, misses = prepared_cache.hits, prepared_cache.misses
+    image = _prepare_cached(prepared_cache, image_file, color, min_size,
+                            verbose)
+    return image, prepared_cache.hits - hits, prepared_cache.misses - misses
 
 
 def _prepare_image(image_file, color=False,
                    min_size=settings.DEFAULT_QUERY_MIN_SIZE, verbose=True):
-    """Loads a single query image from disk and prepares it for sending.
+    """Loads a single query image and prepares it for sending.
 
     If no conversion is used, then the loaded image is returned unchanged.
     Otherwise, the image is converted using PILLOW and encoded as a JPEG image.
     Arguments:
-      image_file - Path to the query image file.
+      image_file - Path to the query image file, or the query image itself:
+                   encoded image as bytes, bytearray or memoryview (sent
+                   as is, without copies, if no conversion is needed),
+                   binary file object, PIL image or numpy uint8 array
+                   (HxW grayscale or HxWx3 RGB).
       color      - Disables grayscale conversion.
                    Often color images do not give better result.
       min_size   - Sets the shorter dimension for query resizing.
                    Rescaling can be disabled by using using min_size = -1.
       verbose    - Shows all image transformations performed to the query.
     """
-    # check if image conversions needed
-    if color and min_size <= 0:
+    phases = _Phases("prepare.")
+    # check if image conversions needed (decoded images are always encoded)
+    if color and min_size <= 0 and not _is_decoded(image_file):
         # no conversion needed so simply open, load, and return the image
         try:
-            image = open(image_file, 'rb').read()
+            image = _read_image(image_file)
         except IOError:
             if verbose:
                 print("Image Opening Error!")
             raise
         else:
+            phases.done("open", size=_payload_size(image))
             if verbose:
                 print("Sending Original Image")
             # return the original image
@@ -109,11 +307,31 @@ def _prepare_image(image_file, color=False,
         # perform conversions using PIL
         try:
             # open the image using PIL
-            image = Image.open(image_file)
+            image = _open_image(image_file)
         except IOError:
             if verbose:
                 print("Image Opening Error!")
             raise
+        phases.done("open")
+
+        xsize, ysize = image.size
+        if min_size > 0:
+            # resize min of height or width to be 'min_size'px
+            min_img_size = min(xsize, ysize)
+            scale_factor = float(min_size) / float(min_img_size)
+            newxsize = int(xsize * scale_factor)
+            newysize = int(ysize * scale_factor)
+
+            if settings.QUERY_DRAFT_DECODE and scale_factor < 1 \
+                    and image is not image_file:
+                # let the JPEG decoder skip the detail lost by the resize,
+                # decoding at a reduced scale (and straight to grayscale)
+                image.draft(None if color else "L", (newxsize, newysize))
+                if verbose and image.size != (xsize, ysize):
+                    print("Draft Decoding with Size (%d,%d)" % image.size)
+
+        image.load()
+        phases.done("decode")
 
         if not color:
             # convert the image to grayscale
@@ -124,23 +342,19 @@ def _prepare_image(image_file, color=False,
                     print("Image Conversion Error!")
                 raise
             else:
+                phases.done("convert")
                 if verbose:
                     print("Grayscale Conversion")
 
         if min_size > 0:
-            # resize min of height or width to be 'min_size'px
-            xsize, ysize = image.size
-            min_img_size = min(xsize, ysize)
-            scale_factor = float(min_size) / float(min_img_size)
-            newxsize = int(xsize * scale_factor)
-            newysize = int(ysize * scale_factor)
             try:
-                image = image.resize((newxsize, newysize))
+                image = image.resize((newxsize, newysize), _RESAMPLE)
             except IOError:
                 if verbose:
                     print("Image Resizing Error")
                 raise
             else:
+                phases.done("resize")
                 if verbose:
                     print("Original Image Size (%d,%d)" % (xsize, ysize))
                     print("Sending Query with Size (%d,%d)" % image.size)
@@ -148,6 +362,102 @@ def _prepare_image(image_file, color=False,
         # write the converted image into a buffer performing JPEG encoding
         string_io = BytesIO()
         image.save(string_io, "JPEG", quality=settings.DEFAULT_IMG_QUALITY)
+        content = string_io.getvalue()
+        phases.done("encode", size=len(content))
 
         # return the converted image
-        return string_io.getvalue()
+        return content
+
+
+def _normalize_image(image_file, max_size=None, quality=None):
+    """Prepares a reference image for uploading, reusing the query pipeline.
+
+    The image is downscaled so that its longer dimension is at most
+    @max_size, rotated as told by its EXIF orientation, stripped of its
+    metadata and recompressed as a JPEG image of the given @quality.
+    Return a (content, saved_bytes) tuple. The original content is returned
+    when it is already within @max_size and smaller than the recompressed
+    image.
+    """
+    if max_size is None:
+        max_size = settings.DEFAULT_REFERENCE_MAX_SIZE
+    if quality is None:
+        quality = settings.DEFAULT_REFERENCE_QUALITY
+
+    original = _read_image(image_file)
+    image = _open_image(original)
+
+    xsize, ysize = image.size
+    scale_factor = float(max_size) / float(max(xsize, ysize))
+    # the size is taken from the original dimensions, the draft decoding
+    # already reduces them
+    newsize = (int(xsize * scale_factor), int(ysize * scale_factor))
+    if scale_factor < 1:
+        image.draft("RGB", newsize)
+    decoded_size = image.size
+    _exif_transpose = getattr(ImageOps, 'exif_transpose', None)
+    if _exif_transpose is not None:
+        image = _exif_transpose(image)
+    if image.size != decoded_size:
+        # rotated by its EXIF orientation
+        newsize = (newsize[1], newsize[0])
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    if scale_factor < 1:
+        image = image.resize(newsize, _RESAMPLE)
+
+    # saving without exif or any other info strips the metadata
+    string_io = BytesIO()
+    image.save(string_io, "JPEG", quality=quality, optimize=True)
+    content = string_io.getvalue()
+
+    original_size = _payload_size(original)
+    if scale_factor >= 1 and len(content) >= original_size:
+        return original, 0
+    return content, original_size - len(content)
+
+
+def _is_buffer(source):
+    "Return True if @source is an encoded image held in memory"
+    # in python 2 a str is a path, despite being bytes
+    return isinstance(source, (bytearray, memoryview)) or \
+        (isinstance(source, bytes) and not isinstance(source, str))
+
+
+def _is_path(source):
+    "Return True if @source is the path to an image file"
+    # unicode paths too in python 2
+    return isinstance(source, (str, type(u"")))
+
+
+def _is_decoded(source):
+    "Return True if @source is a decoded image (PIL image or numpy array)"
+    return isinstance(source, Image.Image) or \
+        hasattr(source, '__array_interface__')
+
+
+def _read_image(source):
+    "Return the encoded image @source, reading it if needed"
+    if _is_buffer(source):
+        return source
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as image_file:
+        return image_file.read()
+
+
+def _open_image(source):
+    "Return the PIL image of @source, decoded lazily when possible"
+    if isinstance(source, Image.Image):
+        return source
+    if hasattr(source, '__array_interface__'):
+        # numpy array, without importing numpy
+        return Image.fromarray(source)
+    if _is_buffer(source):
+        return Image.open(BytesIO(source))
+    return Image.open(source)
+
+
+def _payload_size(image):
+    "Return the number of bytes of a prepared query @image"
+    return memoryview(image).nbytes
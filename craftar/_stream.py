@@ -0,0 +1,219 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the recognition of live streams of frames, e.g. camera feeds.
+
+Querying every frame floods the API with redundant queries whose answers
+arrive late. Instead, frames that barely differ from the last query are
+skipped, at most a few requests are in flight, and a frame waiting for a
+free request is replaced by any newer one.
+"""
+
+import threading
+from collections import namedtuple
+from timeit import default_timer as _timer
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from craftar import settings
+from craftar._cache import _image_hash, _hamming
+from craftar._recognition import _is_buffer, _open_image, _prepare_image, \
+    _search_hedged
+
+StreamResult = namedtuple('StreamResult',
+                          'frame_id response error latency elapsed')
+
+_DONE = object()
+
+
+class StreamRecognizer(object):
+    """Recognizes a stream of frames, returning the results as they arrive.
+
+    Frames are submitted with submit(), or fed from an iterable or a queue
+    by run(). The results are StreamResult tuples (frame_id, response,
+    error, latency, elapsed): error is the exception raised instead of a
+    response, latency the seconds since the frame was submitted and elapsed
+    the round-trip time of its request.
+
+    Arguments:
+      token         - Token for the target collection.
+      max_in_flight - Maximum number of frames being recognized at once.
+      threshold     - Frames whose perceptual hash is within this Hamming
+                      distance of the last query are skipped. -1 sends
+                      every frame.
+      color, min_size, hedger, timeout - As in search().
+
+    The remaining keyword arguments (embed_custom, embed_tracking, bbox,
+    app_id, strategy, version) are the same as in search().
+
+    Attributes:
+      frames, skipped, dropped, sent - Number of frames submitted, skipped
+                                       as unchanged, replaced by a newer one
+                                       while waiting, and queried.
+    """
+
+    def __init__(self, token, max_in_flight=2, threshold=4, color=False,
+                 min_size=settings.DEFAULT_QUERY_MIN_SIZE, hedger=None,
+                 timeout=None, embed_custom=False, embed_tracking=False,
+                 bbox=False, app_id=None, strategy="closeup", version=None):
+        self.token = token
+        self.threshold = threshold
+        self.color = color
+        self.min_size = min_size
+        self.hedger = hedger
+        self.timeout = timeout
+        self.options = (embed_custom, embed_tracking, bbox, app_id, strategy,
+                        version)
+        self.frames = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.sent = 0
+        self._pending = None  # (frame_id, frame, submitted), newest frame
+        self._last_hash = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._results = queue.Queue()
+        self._workers = [threading.Thread(target=self._work)
+                         for _ in range(max(1, max_in_flight))]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, frame, frame_id=None):
+        """Queue a frame for recognition, replacing the one waiting if any.
+        Return immediately.
+
+        Arguments:
+          frame    - The frame, as a numpy uint8 array, a PIL image or an
+                     encoded image (bytes).
+          frame_id - Identifier returned with its result. Defaults to the
+                     number of frames submitted before.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError("Submitting a frame to a closed recognizer")
+            if frame_id is None:
+                frame_id = self.frames
+            self.frames += 1
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame_id, frame, _timer())
+            self._condition.notify()
+
+    def result(self, timeout=None):
+        """Return the next StreamResult, waiting up to @timeout seconds,
+        or None once closed and every result was returned. Raise
+        queue.Empty on timeout."""
+        result = self._results.get(timeout=timeout)
+        if result is _DONE:
+            # for the other consumers, if any
+            self._results.put(_DONE)
+            return None
+        return result
+
+    def run(self, frames):
+        """Submit the frames of @frames as fast as they come and yield the
+        StreamResult of the ones recognized, closing the recognizer at the
+        end. @frames is an iterable, or a queue from which frames are taken
+        until a None is found."""
+        if hasattr(frames, 'get') and hasattr(frames, 'put'):
+            frames = _iter_queue(frames)
+
+        def feed():
+            try:
+                for frame in frames:
+                    self.submit(frame)
+            finally:
+                self.close(wait=False)
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+        while True:
+            result = self.result()
+            if result is None:
+                return
+            yield result
+
+    def close(self, wait=True):
+        """Stop accepting frames. The frame waiting, if any, and the ones in
+        flight are still recognized, @wait tells whether to wait for them"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        def finish():
+            for worker in self._workers:
+                worker.join()
+            self._results.put(_DONE)
+
+        if wait:
+            finish()
+        else:
+            finisher = threading.Thread(target=finish)
+            finisher.daemon = True
+            finisher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _work(self):
+        "Recognize the newest frame, one at a time, until closed"
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                frame_id, frame, submitted = self._pending
+                self._pending = None
+            result = self._recognize(frame_id, frame, submitted)
+            if result is not None:
+                self._results.put(result)
+
+    def _recognize(self, frame_id, frame, submitted):
+        "Return the StreamResult of a frame, or None if it is skipped"
+        try:
+            image_hash = _image_hash(frame if _is_buffer(frame)
+                                     else _open_image(frame))
+            with self._condition:
+                if self.threshold >= 0 and self._last_hash is not None and \
+                        _hamming(image_hash, self._last_hash) <= \
+                        self.threshold:
+                    self.skipped += 1
+                    return None
+                self._last_hash = image_hash
+                self.sent += 1
+            image = _prepare_image(frame, self.color, self.min_size, False)
+            start_time = _timer()
+            response = _search_hedged(self.hedger, self.token, image,
+                                      self.options, self.timeout)
+        except Exception as error:
+            with self._condition:
+                # so that the next similar frame is queried again
+                self._last_hash = None
+            return StreamResult(frame_id, None, error,
+                                _timer() - submitted, None)
+        now = _timer()
+        return StreamResult(frame_id, response, None, now - submitted,
+                            now - start_time)
+
+
+def _iter_queue(frames):
+    "Yield the frames taken from the queue @frames until a None"
+    while True:
+        # not iter(frames.get, None), comparing arrays to None is ambiguous
+        frame = frames.get()
+        if frame is None:
+            return
+        yield frame
@@ -0,0 +1,310 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the download of the bundles returned by sync into a local store.
+
+Files are downloaded concurrently, resumed with HTTP range requests if
+interrupted, and stored by the SHA-256 of their content. A file whose hash
+(or, without one, whose ETag) is unchanged since the previous sync is not
+downloaded again.
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from craftar._client import get_client
+from craftar._common import _validate_response
+
+# keys of the sync response holding the url of a file, and its hash
+_URL_KEYS = ("url", "bundle_url", "download_url", "file")
+_HASH_KEYS = ("sha256", "sha1", "md5", "hash", "checksum")
+# algorithms of the hexadecimal hashes, by length
+_HASH_ALGORITHMS = {32: "md5", 40: "sha1", 64: "sha256"}
+_CHUNK_SIZE = 256 * 1024
+
+BundleFile = namedtuple('BundleFile', 'url path digest downloaded')
+
+
+class BundleStore(object):
+    """Content addressed store of downloaded files.
+
+    Files are kept as <directory>/objects/<sha256[:2]>/<sha256>, along with
+    an index (a SQLite database) of the url, hash and ETag they were
+    downloaded from. Interrupted downloads are kept in
+    <directory>/partial and resumed.
+
+    Arguments:
+      directory - Root of the store, created if missing.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        for subdirectory in ("objects", "partial"):
+            path = os.path.join(directory, subdirectory)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"),
+            check_same_thread=False)
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS files (
+                url TEXT PRIMARY KEY, remote_hash TEXT, etag TEXT,
+                digest TEXT NOT NULL, size INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS files_remote_hash
+                ON files (remote_hash);
+        """)
+
+    def path(self, digest):
+        "Return the path of the file with the SHA-256 @digest"
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def partial_path(self, url):
+        "Return the path of the interrupted download of @url"
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, "partial", name)
+
+    def lookup(self, url, remote_hash=None):
+        """Return the (digest, etag) of the stored file downloaded from @url,
+        or with the same @remote_hash, or None"""
+        with self._lock:
+            row = None
+            if remote_hash:
+                row = self.connection.execute(
+                    "SELECT digest, etag FROM files WHERE remote_hash = ?",
+                    (remote_hash,)).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT digest, etag FROM files WHERE url = ?",
+                    (url,)).fetchone()
+        if row is None or not os.path.exists(self.path(row[0])):
+            return None
+        return row
+
+    def add(self, url, remote_hash, etag, partial_path, digest):
+        "Move a completed download into the store and record it"
+        path = self.path(digest)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another download meanwhile
+                pass
+        size = os.path.getsize(partial_path)
+        if os.path.exists(path):
+            # the same content was downloaded from another url
+            os.remove(partial_path)
+        else:
+            shutil.move(partial_path, path)
+        self.record(url, remote_hash, etag, digest, size)
+        return path
+
+    def record(self, url, remote_hash, etag, digest, size=None):
+        if size is None:
+            size = os.path.getsize(self.path(digest))
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (url, remote_hash, etag, digest, size))
+
+    def close(self):
+        self.connection.close()
+
+
+def sync_bundles(token, app_id, version, store, bundled=True, tag=None,
+                 concurrency=4, retries=3, verbose=False):
+    """Sync as sync() does, and download the files of the response into
+    @store, skipping the ones already there.
+
+    Every dictionary of the response with a url (under one of the keys
+    url, bundle_url, download_url or file) is a file to download. Its hash,
+    if any (under sha256, sha1, md5, hash or checksum), tells whether the
+    file changed since the previous sync, and is verified after downloading
+    it. Otherwise the ETag of the previous download is revalidated.
+
+    Return the response of sync and the list of BundleFile tuples
+    (url, path, digest, downloaded), where path is the stored file and
+    digest its SHA-256.
+
+    Arguments:
+      store       - BundleStore, or the path to its directory.
+      concurrency - Number of files downloaded at the same time.
+      retries     - Number of times an interrupted download is resumed.
+    """
+    # not a module level import, _recognition loads Pillow
+    from craftar._recognition import _sync_request
+
+    if not isinstance(store, BundleStore):
+        store = BundleStore(store)
+    sync_response = _sync_request(token, app_id, version, bundled, tag)
+    _validate_response(sync_response)
+    response = sync_response.json()
+    files = _find_files(response)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        bundle_files = list(executor.map(
+            lambda file_info: _download(store, retries, verbose, *file_info),
+            files))
+    finally:
+        executor.shutdown(wait=True)
+    return response, bundle_files
+
+
+def _find_files(response):
+    "Return the (url, hash) of every file of the sync @response"
+    files = []
+    seen = set()
+    pending = deque([response])
+    while pending:
+        value = pending.popleft()
+        if isinstance(value, dict):
+            url = next((value[key] for key in _URL_KEYS
+                        if _is_url(value.get(key))), None)
+            if url is not None and url not in seen:
+                seen.add(url)
+                remote_hash = next((value[key] for key in _HASH_KEYS
+                                    if value.get(key)), None)
+                files.append((url, remote_hash))
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return files
+
+
+def _is_url(value):
+    return isinstance(value, (str, type(u""))) and \
+        value.startswith(("http://", "https://"))
+
+
+def _download(store, retries, verbose, url, remote_hash):
+    "Download @url into @store unless it is already there"
+    found = store.lookup(url, remote_hash)
+    if found is not None and remote_hash:
+        digest, etag = found
+        store.record(url, remote_hash, etag, digest)
+        return BundleFile(url, store.path(digest), digest, False)
+
+    partial_path = store.partial_path(url)
+    etag_path = partial_path + ".etag"
+    headers = {}
+    if found is not None and found[1]:
+        headers['If-None-Match'] = found[1]
+
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(partial_path) \
+            if os.path.exists(partial_path) else 0
+        request_headers = dict(headers)
+        if offset:
+            request_headers['Range'] = "bytes=%d-" % offset
+            partial_etag = _read_etag(etag_path)
+            if partial_etag:
+                # the whole file is sent instead if it changed meanwhile
+                request_headers['If-Range'] = partial_etag
+        try:
+            response = get_client().get(url, headers=request_headers,
+                                        stream=True)
+            try:
+                if response.status_code == 304:
+                    digest = found[0]
+                    if verbose:
+                        print("Unchanged %s" % url)
+                    return BundleFile(url, store.path(digest), digest, False)
+                if response.status_code == 416:
+                    # the partial file is complete, or stale
+                    os.remove(partial_path)
+                    continue
+                _validate_response(response)
+                if response.status_code != 206:
+                    # the server ignored the range, start over
+                    offset = 0
+                    _write_etag(etag_path, response.headers.get('ETag'))
+                expected_size = _expected_size(response)
+                with open(partial_path, "ab" if offset else "wb") as output:
+                    for chunk in response.iter_content(_CHUNK_SIZE):
+                        output.write(chunk)
+            finally:
+                response.close()
+        except requests.RequestException:
+            # the connection failed, or was closed in the middle of the
+            # body: resume from what was written
+            if attempt == retries:
+                raise
+            continue
+
+        size = os.path.getsize(partial_path)
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:
+                # not the file the partial download started with
+                os.remove(partial_path)
+            if attempt == retries:
+                raise IOError("Incomplete download of %s, %d of %d bytes" %
+                              (url, size, expected_size))
+            # a body cut short without an error, resume it
+            continue
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+        digest = _verify(partial_path, remote_hash)
+        path = store.add(url, remote_hash, response.headers.get('ETag'),
+                         partial_path, digest)
+        if verbose:
+            print("Downloaded %s" % url)
+        return BundleFile(url, path, digest, True)
+    raise IOError("Failed to download %s" % url)
+
+
+def _expected_size(response):
+    """Return the size of the whole file sent by @response, as told by its
+    Content-Range or Content-Length header, or None if unknown"""
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # the length of the encoded body, not of the file
+        return None
+    if response.status_code == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def _read_etag(path):
+    "Return the ETag of an interrupted download, if known"
+    try:
+        with open(path) as etag_file:
+            return etag_file.read()
+    except IOError:
+        return None
+
+
+def _write_etag(path, etag):
+    if etag:
+        with open(path, "w") as etag_file:
+            etag_file.write(etag)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _verify(path, remote_hash):
+    """Return the SHA-256 of the file at @path, after checking it against
+    the @remote_hash of the sync response, if its algorithm is known"""
+    digest = hashlib.sha256()
+    algorithm = remote_hash and _HASH_ALGORITHMS.get(len(remote_hash))
+    expected = algorithm and hashlib.new(algorithm)
+    with open(path, "rb") as downloaded:
+        for chunk in iter(lambda: downloaded.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            if expected:
+                expected.update(chunk)
+    if expected and expected.hexdigest() != remote_hash.lower():
+        os.remove(path)
+        raise IOError("Corrupt download, %s mismatch" % algorithm)
+    return digest.hexdigest()
@@ -0,0 +1,399 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the bulk upload of a directory of reference images.
+
+Items and images are created on a pool of threads sharing the pooled client.
+Every created object is recorded in a journal (a SQLite database), so that
+running the same upload again skips the work already done instead of
+starting over or creating duplicates.
+
+Two different organizations of images are supported:
+ * Flat, where each image becomes a new item.
+ * Hierarchical, where each subdirectory of images becomes a new item.
+
+In both cases, item metadata can be provided via a file with extension .meta
+and the same basename as the image (flat) or the subdirectory (hierarchical),
+containing key=value lines with the keys name, url and custom.
+"""
+
+import collections
+import mimetypes
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+
+from craftar._management import create_collection, create_image, \
+    create_item, delete_item, get_collection, _create_image_content, \
+    _normalized_name
+from craftar._recognition import _normalize_image
+
+
+class UploadJournal(object):
+    """Records the collections, items and images already uploaded. Items and
+    images are recorded per collection, so that the same directory can be
+    uploaded to another collection with the same journal.
+
+    Arguments:
+      path - Path to the SQLite database, created if missing.
+             Defaults to an in-memory database, which remembers nothing
+             between runs.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS collections (
+                directory TEXT PRIMARY KEY, uuid TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS items (
+                collection TEXT NOT NULL, path TEXT NOT NULL,
+                uuid TEXT NOT NULL, PRIMARY KEY (collection, path));
+            CREATE TABLE IF NOT EXISTS images (
+                collection TEXT NOT NULL, path TEXT NOT NULL,
+                item_path TEXT NOT NULL, uuid TEXT NOT NULL,
+                PRIMARY KEY (collection, path));
+        """)
+
+    def _get(self, query, *args):
+        row = self.connection.execute(query, args).fetchone()
+        return row and row[0]
+
+    def _set(self, query, *args):
+        with self.connection:
+            self.connection.execute(query, args)
+
+    def get_collection(self, directory):
+        return self._get("SELECT uuid FROM collections WHERE directory = ?",
+                         directory)
+
+    def add_collection(self, directory, uuid):
+        self._set("INSERT OR REPLACE INTO collections VALUES (?, ?)",
+                  directory, uuid)
+
+    def get_item(self, collection, path):
+        return self._get("SELECT uuid FROM items "
+                         "WHERE collection = ? AND path = ?",
+                         collection, path)
+
+    def add_item(self, collection, path, uuid):
+        self._set("INSERT OR REPLACE INTO items VALUES (?, ?, ?)",
+                  collection, path, uuid)
+
+    def remove_item(self, collection, path):
+        self._set("DELETE FROM items WHERE collection = ? AND path = ?",
+                  collection, path)
+
+    def count_images(self, collection, item_path):
+        return self._get("SELECT COUNT(*) FROM images "
+                         "WHERE collection = ? AND item_path = ?",
+                         collection, item_path)
+
+    def has_image(self, collection, path):
+        return self._get("SELECT 1 FROM images "
+                         "WHERE collection = ? AND path = ?",
+                         collection, path) == 1
+
+    def add_image(self, collection, path, item_path, uuid):
+        self._set("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                  collection, path, item_path, uuid)
+
+    def close(self):
+        self.connection.close()
+
+
+class UploadStats(object):
+    "Counters and throughput of a bulk upload"
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.end_time = None
+        self.items_created = 0
+        self.items_skipped = 0
+        self.items_deleted = 0
+        self.images_uploaded = 0
+        self.images_skipped = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0  # by normalizing the images before uploading
+        self.errors = []  # (path, error message) tuples
+
+    @property
+    def elapsed(self):
+        "Seconds since the upload started, or that it took if finished"
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def images_per_second(self):
+        return self.images_uploaded / max(self.elapsed, 1e-6)
+
+    @property
+    def megabytes_per_second(self):
+        return self.bytes_uploaded / 1e6 / max(self.elapsed, 1e-6)
+
+    def summary(self):
+        return ("%d items created (%d skipped, %d deleted), "
+                "%d images uploaded (%d skipped, %.2f MB saved), %d errors "
+                "in %.1fsec: %.1f images/sec, %.2f MB/sec" % (
+                    self.items_created, self.items_skipped,
+                    self.items_deleted, self.images_uploaded,
+                    self.images_skipped, self.bytes_saved / 1e6,
+                    len(self.errors), self.elapsed, self.images_per_second,
+                    self.megabytes_per_second))
+
+
+class _Item(object):
+    "Upload state of a single item"
+
+    def __init__(self, path, metadata, images):
+        self.path = path
+        self.metadata = metadata
+        self.images = images
+        self.uuid = None
+        self.pending = 0
+        self.uploaded = 0
+
+
+def upload_directory(api_key, directory, collection=None, workers=8,
+                     journal=None, normalize=False, max_size=None,
+                     processes=None, verbose=False):
+    """Upload all the images in @directory, creating one item per image or
+    subdirectory of images. Return the uploaded collection and the
+    UploadStats of the upload.
+
+    Arguments:
+      collection - uuid of the collection for the new items. By default a
+                   collection named after the directory is created.
+      workers    - Number of requests in flight.
+      journal    - UploadJournal, or the path to its database, recording the
+                   uploaded objects. Reruns with the same journal skip them.
+      normalize  - Downscale the images to @max_size (by default
+                   settings.DEFAULT_REFERENCE_MAX_SIZE), strip their EXIF
+                   metadata and recompress them before uploading.
+      processes  - Number of processes normalizing the images. None uses
+                   one per CPU.
+      verbose    - Print every created object and the throughput.
+
+    Failed requests are retried by the client (see Client's max_retries),
+    which only sends an object creation again when the API didn't process
+    it, so that no duplicates are created.
+    """
+    directory = os.path.abspath(directory.rstrip("/"))
+    if not isinstance(journal, UploadJournal):
+        journal = UploadJournal(journal or ":memory:")
+    stats = UploadStats()
+
+    collection = _get_or_create_collection(api_key, directory, collection,
+                                           journal, verbose)
+
+    process_pool = None
+    if normalize:
+        process_pool = ProcessPoolExecutor(max_workers=processes)
+        # start the processes now, before any thread of the upload exists
+        process_pool.submit(int).result()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}  # future -> (item, image path or None)
+    ready = collections.deque()  # (item, image path or None) to submit
+    items = _plan_items(directory)
+    collection_uuid = collection["uuid"]
+
+    def submit(item, image):
+        if image is None:
+            future = executor.submit(
+                create_item, api_key, collection=collection_uuid,
+                trackable=False, **item.metadata)
+        elif process_pool is not None:
+            normalized = process_pool.submit(_normalize_image, image,
+                                             max_size)
+            future = executor.submit(_upload_normalized, api_key, item.uuid,
+                                     image, normalized)
+        else:
+            future = executor.submit(_upload_image, api_key, item.uuid,
+                                     image)
+        pending[future] = (item, image)
+
+    def queue_images(item):
+        for image in item.images:
+            if journal.has_image(collection_uuid,
+                                 _relpath(image, directory)):
+                stats.images_skipped += 1
+            else:
+                item.pending += 1
+                ready.append((item, image))
+        _finish_item(api_key, collection_uuid, item, journal, stats,
+                     verbose)
+
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                if ready:
+                    submit(*ready.popleft())
+                    continue
+                item = next(items, None)
+                if item is None:
+                    break
+                item.uuid = journal.get_item(collection_uuid, item.path)
+                if item.uuid is None:
+                    ready.append((item, None))
+                else:
+                    stats.items_skipped += 1
+                    queue_images(item)
+            if not pending:
+                break
+
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                item, image = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stats.errors.append((image or item.path, str(e)))
+                    if image is not None:
+                        item.pending -= 1
+                        _finish_item(api_key, collection_uuid, item, journal,
+                                     stats, verbose)
+                    continue
+
+                if image is None:
+                    item.uuid = result["uuid"]
+                    journal.add_item(collection_uuid, item.path, item.uuid)
+                    stats.items_created += 1
+                    if verbose:
+                        print("(%s) -> Created item '%s'" % (
+                            stats.items_created, result["name"]))
+                    queue_images(item)
+                else:
+                    result, uploaded_bytes, saved_bytes = result
+                    journal.add_image(collection_uuid,
+                                      _relpath(image, directory), item.path,
+                                      result["uuid"])
+                    item.pending -= 1
+                    item.uploaded += 1
+                    stats.images_uploaded += 1
+                    stats.bytes_uploaded += uploaded_bytes
+                    stats.bytes_saved += saved_bytes
+                    if verbose:
+                        print("    uploaded image '%s' " % result["name"])
+                        if stats.images_uploaded % 100 == 0:
+                            print("--> %s" % stats.summary())
+                    _finish_item(api_key, collection_uuid, item, journal,
+                                 stats, verbose)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if process_pool is not None:
+            process_pool.shutdown(wait=True)
+        stats.end_time = time.time()
+
+    return collection, stats
+
+
+def _upload_image(api_key, item, image):
+    "Upload @image, return the created image and the bytes uploaded and saved"
+    result = create_image(api_key, item=item, filename=image)
+    return result, os.path.getsize(image), 0
+
+
+def _upload_normalized(api_key, item, image, normalized):
+    "Upload the @normalized future content of @image"
+    content, saved_bytes = normalized.result()
+    result = _create_image_content(api_key, item,
+                                   _normalized_name(image, content), content)
+    return result, len(content), saved_bytes
+
+
+def _finish_item(api_key, collection, item, journal, stats, verbose):
+    "Delete an item left without images, once all of them were tried"
+    if item.pending or item.uploaded or \
+            journal.count_images(collection, item.path):
+        return
+    try:
+        delete_item(api_key, item.uuid)
+    except Exception as e:
+        stats.errors.append((item.path, str(e)))
+    else:
+        journal.remove_item(collection, item.path)
+        stats.items_deleted += 1
+        if verbose:
+            print("    errors uploading images - item deleted")
+
+
+def _get_or_create_collection(api_key, directory, uuid, journal, verbose):
+    "Return the collection to upload to, created once per directory"
+    uuid = uuid or journal.get_collection(directory)
+    if uuid:
+        # Check if the specified collection exists
+        return get_collection(api_key, uuid=uuid)
+
+    collection_name = os.path.basename(directory)
+    collection = create_collection(api_key, name=collection_name)
+    journal.add_collection(directory, collection["uuid"])
+    if verbose:
+        print("--> Created collection '%s'" % collection_name)
+    return collection
+
+
+def _plan_items(directory):
+    "Yield the items to upload from @directory, with metadata and images"
+    for name in sorted(os.listdir(directory)):
+        item_path = os.path.join(directory, name)
+
+        if os.path.isdir(item_path):
+            # The item is a directory so we will upload all the images inside
+            image_list = [os.path.join(item_path, f)
+                          for f in sorted(os.listdir(item_path))]
+            # Keep just the files that are really an image
+            image_list = list(filter(_is_image, image_list))
+        elif _is_image(item_path):
+            # The item is just one image
+            image_list = [item_path]
+        else:
+            # This is neither an image or a directory, moving on...
+            continue
+
+        if not image_list:
+            continue
+
+        # Items may contain metadata inside a file with extension .meta and the
+        # same name as the item. The metadata is specified as key=value lines.
+        metadata = _parse_metadata("%s.meta" % os.path.splitext(item_path)[0])
+
+        # The allowed metadata keys are: name, url and custom.
+        yield _Item(_relpath(item_path, directory), {
+            'name': metadata.get("name", os.path.splitext(name)[0]),
+            'url': metadata.get("url", ""),
+            'custom': metadata.get("custom", ""),
+        }, image_list)
+
+
+def _parse_metadata(metadata_path):
+    try:
+        with open(metadata_path, "r") as metadata_file:
+            content = metadata_file.readlines()
+    except IOError:
+        content = []
+
+    metadata = dict()
+
+    for line in content:
+        if not line or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        metadata[key.strip()] = value.strip()
+
+    return metadata
+
+
+def _is_image(path):
+    mtype = mimetypes.guess_type(path)[0]
+    return bool(mtype and mtype.startswith("image"))
+
+
+def _relpath(path, directory):
+    return os.path.relpath(path, directory)
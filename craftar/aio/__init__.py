@@ -0,0 +1,14 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides asyncio access to the CraftAR API
+
+Mirrors the functions of the craftar package as coroutines, sending the
+requests through an aiohttp session. Requires aiohttp to be installed.
+"""
+
+from craftar.aio._client import AsyncClient, get_client, set_client
+from craftar.aio._recognition import search, sync
+from craftar.aio._management import *
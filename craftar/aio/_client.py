@@ -0,0 +1,118 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Provides the asyncio HTTP client shared by the coroutines of craftar.aio"
+
+import aiohttp
+
+from craftar import settings
+from craftar import _instrumentation
+from craftar._common import _loads
+
+
+class AsyncClient(object):
+    """Asyncio HTTP client holding a pool of keep-alive connections.
+
+    The aiohttp session is created on the first request, so the client can
+    be built outside of the event loop that uses it.
+
+    Arguments:
+      pool_maxsize - Maximum number of connections kept open per host.
+                     Defaults to settings.POOL_MAXSIZE.
+      limit        - Maximum number of connections open in total.
+                     Defaults to 0, meaning no limit.
+    """
+
+    def __init__(self, pool_maxsize=None, limit=0):
+        if pool_maxsize is None:
+            pool_maxsize = settings.POOL_MAXSIZE
+        self.pool_maxsize = pool_maxsize
+        self.limit = limit
+        self.session = None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': settings.USER_AGENT},
+            )
+        return self.session
+
+    async def request(self, method, url, **kwargs):
+        "Send a request and return the response with its body already read"
+        session = self._get_session()
+        start_time = _instrumentation._timer()
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+        if _instrumentation._hooks:
+            _instrumentation._emit(
+                "http", _instrumentation._timer() - start_time,
+                method=method, url=url.split("?", 1)[0],
+                status_code=response.status, request_bytes=None,
+                response_bytes=len(body), headers_time=None)
+        return Response(response, body)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    async def close(self):
+        "Close all the pooled connections"
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class Response(object):
+    "A fully read response, exposing the same interface as requests does"
+
+    def __init__(self, response, content):
+        self._response = response
+        self.status_code = response.status
+        self.headers = response.headers
+        self.content = content
+
+    def json(self):
+        return _loads(self.content)
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+
+_default_client = None
+
+
+def get_client():
+    "Return the client used by the coroutines of craftar.aio"
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncClient()
+    return _default_client
+
+
+def set_client(client):
+    """Replace the client used by the coroutines of craftar.aio.
+    Passing None restores a default client on the next call.
+    Return the previous client, which is not closed."""
+    global _default_client
+    previous = _default_client
+    _default_client = client
+    return previous
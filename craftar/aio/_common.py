@@ -0,0 +1,124 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Provides common internal coroutines for accessing CraftAR's API"
+
+import asyncio
+import json
+import os
+
+import aiohttp
+
+from craftar._common import HEADERS, _validate, _validate_response, \
+    _parse_object, _get_url
+from craftar.aio._client import get_client
+
+
+def _form_data(data, files=None):
+    "Return a multipart form with the non-empty @data fields and @files"
+    form = aiohttp.FormData()
+    for name, value in (data or {}).items():
+        if value is not None:
+            form.add_field(name, str(value))
+    for name, (filename, content) in (files or {}).items():
+        form.add_field(name, content, filename=filename,
+                       content_type='application/octet-stream')
+    return form
+
+
+async def _read_file(filename):
+    "Read the whole file in an executor, so the event loop never blocks"
+    def read():
+        with open(filename, 'rb') as f:
+            return f.read()
+    content = await asyncio.get_running_loop().run_in_executor(None, read)
+    return os.path.basename(filename), content
+
+
+async def _get_object_list(api_key, object_type, limit=20, offset=0,
+                           filter=None, filters_dict=None):
+    "Get a list of objects"
+    _validate(object_type=object_type)
+
+    url = _get_url(api_key, object_type, None, limit, offset, filter,
+                   filters_dict)
+    response = await get_client().get(url)
+    _validate_response(response)
+
+    object_list = []
+    for unparsed_object in response.json()["objects"]:
+        parsed_object = _parse_object(unparsed_object)
+        object_list.append(parsed_object)
+    return object_list
+
+
+async def _get_object(api_key, object_type, uuid):
+    "Get a single object"
+    _validate(object_type=object_type, uuid=uuid)
+    url = _get_url(api_key, object_type, uuid)
+    response = await get_client().get(url)
+    _validate_response(response)
+    parsed_object = _parse_object(response.json())
+    return parsed_object
+
+
+async def _create_object(api_key, object_type, data):
+    "Create a single object without an attachment"
+    _validate(object_type=object_type, data=data)
+    response = await get_client().post(
+        _get_url(api_key, object_type),
+        data=json.dumps(data),
+        headers=HEADERS,
+    )
+    _validate_response(response)
+    parsed_object = _parse_object(response.json())
+    if response.status_code == 201:
+        return parsed_object
+
+
+async def _create_object_multipart(api_key, object_type, files, data):
+    "Create a single object with an attachment (image file)"
+    _validate(object_type=object_type, data=data)
+    response = await get_client().post(
+        _get_url(api_key, object_type),
+        data=_form_data(data, files),
+    )
+    _validate_response(response)
+    parsed_object = _parse_object(response.json())
+    if response.status_code == 201:
+        return parsed_object
+
+
+async def _update_object(api_key, object_type, uuid, data):
+    "Update a single object"
+    _validate(object_type=object_type, data=data, uuid=uuid)
+    response = await get_client().put(
+        _get_url(api_key, object_type, uuid),
+        data=json.dumps(data),
+        headers=HEADERS,
+    )
+    _validate_response(response)
+    return (response.status_code == 202)
+
+
+async def _update_object_multipart(api_key, object_type, uuid, files, data):
+    "Update a single object with an attachment (image file)"
+    _validate(object_type=object_type, data=data, uuid=uuid)
+    response = await get_client().put(
+        _get_url(api_key, object_type, uuid),
+        data=_form_data(data, files),
+    )
+    _validate_response(response)
+    return (response.status_code == 202)
+
+
+async def _delete_object(api_key, object_type, uuid):
+    "Delete a single object"
+    _validate(object_type=object_type, uuid=uuid)
+    response = await get_client().delete(
+        _get_url(api_key, object_type, uuid),
+    )
+    _validate_response(response)
+    return (response.status_code == 204)
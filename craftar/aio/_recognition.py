@@ -0,0 +1,64 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"""Provides the coroutines for visual recogn. with CraftAR's API.
+
+Query images are prepared in an executor, so decoding and resizing them with
+Pillow never blocks the event loop.
+"""
+
+import asyncio
+
+from craftar import settings
+from craftar._recognition import _prepare_image
+from craftar.aio._client import get_client
+from craftar.aio._common import _form_data
+
+
+async def search(token, filename, embed_custom=False, embed_tracking=False,
+                 bbox=False, app_id=None, strategy="closeup", version=None,
+                 color=False, min_size=settings.DEFAULT_QUERY_MIN_SIZE,
+                 verbose=False, executor=None):
+    """Performs a visual recognition using CraftAR's API.
+
+    Takes the same arguments as craftar.search(), plus:
+      executor - concurrent.futures executor preparing the query image.
+                 Defaults to the default executor of the event loop. Use a
+                 ProcessPoolExecutor to prepare many images in parallel.
+    """
+    image = await asyncio.get_running_loop().run_in_executor(
+        executor, _prepare_image, filename, color, min_size, verbose)
+
+    response = await get_client().post(
+        "%s/%s/search" % (settings.RECOGNITION_HOSTNAME,
+                          settings.RECOGNITION_API_VERSION),
+        data=_form_data({
+            'token': token,
+            'embed_custom': embed_custom and 'true' or 'false',
+            'embed_tracking': embed_tracking and 'true' or 'false',
+            'bbox': bbox and 'true' or 'false',
+            'app_id': app_id,
+            'strategy': strategy,
+            'version': version,
+        }, {'image': ('image', image)}),
+    )
+
+    return response.json()
+
+
+async def sync(token, app_id, version, bundled=True, tag=None):
+    response = await get_client().post(
+        "%s/%s/sync" % (settings.RECOGNITION_HOSTNAME,
+                        settings.RECOGNITION_API_VERSION),
+        data=_form_data({
+            'token': token,
+            'app_id': app_id,
+            'version': version,
+            'bundled': bundled and 'true' or 'false',
+            'tag': tag,
+        }),
+    )
+
+    return response.json()
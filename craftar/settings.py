@@ -17,6 +17,24 @@ USER_AGENT = "CraftAR/1.3.8 (python %s)" % platform.python_version()
 
 DEFAULT_QUERY_MIN_SIZE = 240  # default image transformation parameters
 DEFAULT_IMG_QUALITY = 80  # for jpeg compression, recommended range [75-85]
+QUERY_DRAFT_DECODE = True  # decode jpeg queries at a reduced scale if possible
+
+DEFAULT_REFERENCE_MAX_SIZE = 1024  # longer dimension of normalized references
+DEFAULT_REFERENCE_QUALITY = 90  # jpeg quality of normalized references
+
+DEFAULT_PAGE_SIZE = 100  # objects per request when iterating over lists
+
+POOL_CONNECTIONS = 10  # number of hosts with a pool of open connections
+POOL_MAXSIZE = 10  # maximum number of open connections per host
+
+BACKOFF_FACTOR = 0.5  # seconds, doubled on every retry of a failed request
+BACKOFF_MAX = 30  # seconds, longest wait between two retries
+MAX_RETRIES = 3  # retries of a request failing with a transient error
+RATE_LIMIT = None  # requests per second sent by a client, None for no limit
+RATE_LIMIT_BURST = 10  # requests sent at once after a while without any
+CONNECT_TIMEOUT = 5  # seconds to wait for a connection to be established
+READ_TIMEOUT = 30  # seconds to wait for the server between two reads
+COALESCE_REQUESTS = False  # identical requests in flight share one response
 
 ALLOWED_IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG')
 ALLOWED_OBJECT_TYPES = ["collection", "item", "image", "token", "media",
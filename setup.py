@@ -68,7 +68,8 @@ setup(name='craftar',
       maintainer_email='support@catchoom.com',
       url='http://catchoom.com',
       bugtrack_url="https://github.com/Catchoom/craftar-python/issues",
-      packages=["craftar"],
+      packages=["craftar", "craftar.aio"],
       scripts=['bin/craftar_search', 'bin/craftar_upload'],
-      install_requires=["requests==2.20.0", "Pillow==2.5.3"]
+      install_requires=["requests==2.20.0", "Pillow==2.5.3",
+                        'futures; python_version < "3"']
       )
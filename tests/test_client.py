@@ -0,0 +1,159 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Tests the retries and the rate limiting of the client's scheduler"
+
+import threading
+import time
+import unittest
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+import craftar
+from craftar import settings
+from craftar._multipart import MultipartEncoder
+
+URL = "http://craftar.test/api/"
+
+
+class FakeAdapter(BaseAdapter):
+    """Transport answering the requests sent to every path with the outcomes
+    queued for it: a status code, a (status code, headers) tuple or an
+    exception to raise. The requests sent are recorded with their time and
+    body in sent."""
+
+    def __init__(self):
+        super(FakeAdapter, self).__init__()
+        self.outcomes = {}  # path -> list of outcomes
+        self.sent = []  # (method, path, time, body)
+        self.received = threading.Event()
+
+    def queue(self, path, *outcomes):
+        self.outcomes.setdefault(path, []).extend(outcomes)
+
+    def send(self, request, **kwargs):
+        path = request.url[len(URL):]
+        body = request.body
+        if hasattr(body, 'read'):
+            body = body.read()
+        self.sent.append((request.method, path, time.time(), body))
+        self.received.set()
+        outcomes = self.outcomes.get(path)
+        outcome = outcomes.pop(0) if outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        status_code, headers = outcome if isinstance(outcome, tuple) \
+            else (outcome, {})
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = b"{}"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def count(self, path):
+        return len([sent for sent in self.sent if sent[1] == path])
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        # retry at once, unless told otherwise by Retry-After
+        self.backoff_factor = settings.BACKOFF_FACTOR
+        settings.BACKOFF_FACTOR = 0
+        self.client = craftar.Client(max_retries=3)
+        self.adapter = FakeAdapter()
+        self.client.session.mount("http://", self.adapter)
+
+    def tearDown(self):
+        settings.BACKOFF_FACTOR = self.backoff_factor
+        self.client.close()
+
+    def assertSent(self, method, path, outcomes, status_code, count):
+        self.adapter.queue(path, *outcomes)
+        response = self.client.request(method, URL + path)
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(self.adapter.count(path), count)
+
+    def test_post_retried_on_429_and_503(self):
+        self.assertSent("POST", "429", [429, 201], 201, 2)
+        self.assertSent("POST", "503", [503, 503, 201], 201, 3)
+
+    def test_post_not_retried_on_other_5xx(self):
+        for status_code in (500, 502, 504):
+            self.assertSent("POST", str(status_code), [status_code, 201],
+                            status_code, 1)
+
+    def test_post_retried_on_connect_timeout(self):
+        self.assertSent("POST", "connect",
+                        [requests.ConnectTimeout()], 200, 2)
+
+    def test_post_not_retried_on_read_timeout(self):
+        self.adapter.queue("read", requests.ReadTimeout())
+        with self.assertRaises(requests.ReadTimeout):
+            self.client.post(URL + "read")
+        self.assertEqual(self.adapter.count("read"), 1)
+
+    def test_idempotent_retried_on_5xx(self):
+        for method in ("GET", "PUT"):
+            for status_code in (500, 502, 503, 504):
+                self.assertSent(method, "%s/%s" % (method, status_code),
+                                [status_code, 200], 200, 2)
+
+    def test_idempotent_retried_on_read_timeout(self):
+        self.assertSent("GET", "read", [requests.ReadTimeout()], 200, 2)
+
+    def test_retries_exhausted(self):
+        self.assertSent("GET", "down", [502] * 10, 502, 4)
+
+    def test_retry_after(self):
+        self.assertSent("GET", "busy", [(503, {"Retry-After": "0.5"})],
+                        200, 2)
+        first, second = [sent[2] for sent in self.adapter.sent]
+        self.assertGreaterEqual(second - first, 0.5)
+
+    def test_429_pauses_other_threads(self):
+        self.adapter.queue("limited", (429, {"Retry-After": "0.5"}))
+        thread = threading.Thread(target=self.client.get,
+                                  args=(URL + "limited",))
+        thread.start()
+        self.adapter.received.wait()
+        time.sleep(0.1)
+        self.client.get(URL + "other")
+        thread.join()
+        limited = [sent[2] for sent in self.adapter.sent
+                   if sent[1] == "limited"][0]
+        other = [sent[2] for sent in self.adapter.sent
+                 if sent[1] == "other"][0]
+        self.assertGreaterEqual(other - limited, 0.5)
+
+    def test_rate_limit(self):
+        rate_limiter = craftar.RateLimiter(rate=20, burst=1)
+        start_time = time.time()
+        for _ in range(5):
+            rate_limiter.acquire()
+        # the first one at once, then one every 1/20 seconds
+        self.assertGreaterEqual(time.time() - start_time, 0.19)
+
+    def test_multipart_body_rewound(self):
+        self.adapter.queue("image", 503)
+        with MultipartEncoder({"item": "uuid"},
+                              {"file": ("query.jpg", b"x" * 1000)}) as body:
+            self.client.post(URL + "image", data=body,
+                             headers={'Content-Type': body.content_type})
+        bodies = [sent[3] for sent in self.adapter.sent]
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(len(bodies[0]), len(body))
+        self.assertEqual(bodies[1], bodies[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
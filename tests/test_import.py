@@ -0,0 +1,29 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Tests that importing the package stays within its time budget"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "benchmarks"))
+
+import bench_import
+
+# milliseconds, as the default of bench_import
+BUDGET = 30.0
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_import_within_budget(self):
+        results = bench_import.run(3)
+        self.assertEqual(bench_import.check(results, BUDGET), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
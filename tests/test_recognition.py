@@ -0,0 +1,53 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Tests the normalization of reference images before uploading them"
+
+from io import BytesIO
+import unittest
+
+from PIL import Image
+
+from craftar._recognition import _normalize_image
+
+
+def make_jpeg(size, orientation=None):
+    "Return a JPEG image of @size, with an EXIF @orientation if given"
+    image = Image.new("RGB", size, (200, 100, 50))
+    output = BytesIO()
+    if orientation is None:
+        image.save(output, "JPEG")
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(output, "JPEG", exif=exif)
+    return output.getvalue()
+
+
+def size_of(content):
+    return Image.open(BytesIO(content)).size
+
+
+class NormalizeImageTest(unittest.TestCase):
+
+    def test_downscaled_to_max_size(self):
+        original = make_jpeg((4000, 3000))
+        content, saved = _normalize_image(original, max_size=1024)
+        self.assertEqual(size_of(content), (1024, 768))
+        self.assertEqual(saved, len(original) - len(content))
+
+    def test_rotated_by_exif_orientation(self):
+        # 6: rotated 90 degrees, displayed in portrait
+        content, _ = _normalize_image(make_jpeg((4000, 3000), 6),
+                                      max_size=1024)
+        self.assertEqual(size_of(content), (768, 1024))
+
+    def test_small_image_not_upscaled(self):
+        content, _ = _normalize_image(make_jpeg((800, 600)), max_size=1024)
+        self.assertEqual(size_of(content), (800, 600))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Tests the resumable download of sync bundles against the mock server"
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "benchmarks"))
+
+import craftar
+from mock_server import MockServer
+
+
+class SyncBundlesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.directory = tempfile.mkdtemp(prefix="craftar-test-")
+        self.content = os.urandom(256 * 1024)
+        self.server.add_file("bundle.zip", self.content)
+        craftar.set_client(craftar.Client(max_retries=0))
+
+    def tearDown(self):
+        craftar.set_client(None).close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def sync(self):
+        _, files = craftar.sync_bundles("token", "app", "1.0",
+                                        self.directory)
+        self.assertEqual(len(files), 1)
+        with open(files[0].path, "rb") as stored:
+            self.assertEqual(stored.read(), self.content)
+        return files[0]
+
+    def test_download(self):
+        bundle_file = self.sync()
+        self.assertTrue(bundle_file.downloaded)
+        self.assertEqual(bundle_file.digest,
+                         hashlib.sha256(self.content).hexdigest())
+
+    def test_resume_cut_download(self):
+        # the first download and its first resumption are cut midway
+        self.server.cut("bundle.zip", 2)
+        requests_before = self.server.requests
+        self.assertTrue(self.sync().downloaded)
+        # sync, then the two cut downloads and the last range
+        self.assertEqual(self.server.requests - requests_before, 4)
+
+    def test_cut_download_fails_without_retries(self):
+        self.server.cut("bundle.zip", 10)
+        with self.assertRaises(requests.RequestException):
+            craftar.sync_bundles("token", "app", "1.0", self.directory,
+                                 retries=1)
+        self.assertEqual(os.listdir(os.path.join(self.directory, "objects")),
+                         [])
+
+    def test_unchanged_not_downloaded_again(self):
+        self.sync()
+        self.assertFalse(self.sync().downloaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
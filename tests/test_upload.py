@@ -0,0 +1,70 @@
+#  (C) Catchoom Technologies S.L.
+#  Licensed under the MIT license.
+#  https://github.com/catchoom/craftar-python/blob/master/LICENSE
+#  All warranties and liabilities are disclaimed.
+
+"Tests the resumable upload of a directory against the mock server"
+
+from io import BytesIO
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "benchmarks"))
+
+import craftar
+from mock_server import MockServer
+
+API_KEY = "0" * 40
+
+
+class UploadDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.directory = tempfile.mkdtemp(prefix="craftar-test-")
+        self.journal = os.path.join(self.directory, ".journal.sqlite")
+        output = BytesIO()
+        Image.new("RGB", (64, 48)).save(output, "JPEG")
+        for name in ("a", "b", "c"):
+            with open(os.path.join(self.directory, name + ".jpg"),
+                      "wb") as image:
+                image.write(output.getvalue())
+        craftar.set_client(craftar.Client())
+
+    def tearDown(self):
+        craftar.set_client(None).close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def upload(self, collection=None):
+        return craftar.upload_directory(API_KEY, self.directory, collection,
+                                        journal=self.journal)
+
+    def test_upload(self):
+        _, stats = self.upload()
+        self.assertEqual((stats.items_created, stats.images_uploaded,
+                          stats.errors), (3, 3, []))
+
+    def test_rerun_skips_uploaded(self):
+        collection, _ = self.upload()
+        _, stats = self.upload(collection["uuid"])
+        self.assertEqual((stats.items_created, stats.items_skipped,
+                          stats.images_uploaded, stats.images_skipped),
+                         (0, 3, 0, 3))
+
+    def test_journal_reused_for_other_collection(self):
+        self.upload()
+        other = craftar.create_collection(API_KEY, name="other")
+        _, stats = self.upload(other["uuid"])
+        self.assertEqual((stats.items_created, stats.items_skipped,
+                          stats.images_uploaded), (3, 0, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()